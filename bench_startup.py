@@ -0,0 +1,54 @@
+"""
+Measure the startup cost of simplerulebased.py
+
+Each case runs in a fresh interpreter, so imports aren't cached between runs:
+  before: what importing the module used to cost, eager NLTK import plus the two downloads
+  import: importing the module now
+  first bot: importing it and creating a RuleBasedChatbot (native engine, no NLTK)
+  nltk bot: the same with engine="nltk", which imports NLTK
+
+Run with: python bench_startup.py [runs]
+"""
+import os
+import sys
+import time
+import statistics
+import subprocess
+
+CASES = [
+    ("before", "import nltk; from nltk.chat.util import Chat, reflections; "
+               "nltk.download('punkt'); nltk.download('averaged_perceptron_tagger')"),
+    ("import", "import simplerulebased"),
+    ("first bot", "import simplerulebased; simplerulebased.RuleBasedChatbot()"),
+    ("nltk bot", "import simplerulebased; simplerulebased.RuleBasedChatbot(engine='nltk')"),
+]
+
+
+def time_case(code: str, runs: int):
+    """Median wall time of running code in a new interpreter, None if it fails"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None
+        times.append(elapsed)
+    return statistics.median(times)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline = time_case("pass", runs)
+    print(f"interpreter startup: {baseline * 1000:.1f} ms (subtracted below)")
+    for name, code in CASES:
+        elapsed = time_case(code, runs)
+        if elapsed is None:
+            print(f"{name:>10}: failed (is nltk installed and, for 'before', the network reachable?)")
+        else:
+            print(f"{name:>10}: {(elapsed - baseline) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
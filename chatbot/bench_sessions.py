@@ -0,0 +1,84 @@
+"""
+Measure the memory used per session by StateManager
+
+Compares the compact Session records with the dict-of-dicts layout sessions
+used to have. Run with: python bench_sessions.py [number of sessions]
+"""
+import sys
+import datetime
+import tracemalloc
+
+from statemanager import StateManager
+
+
+def legacy_session() -> dict:
+    """A session in the old dict layout"""
+    return {
+        "created_at": datetime.datetime.now(),
+        "last_active": datetime.datetime.now(),
+        "conversation_history": [],
+        "current_context": None,
+        "entity_memory": {},
+        "preferences": {},
+        "verification_level": "unknown",
+        "last_intent": None,
+        "flags": {
+            "needs_human": False,
+            "has_pending_query": False,
+            "is_new_user": True
+        },
+        "active_flows": [],
+        "flow_states": {}
+    }
+
+
+def use_legacy(session: dict) -> None:
+    session["last_intent"] = "fees"
+    session["entity_memory"]["cryptocurrency"] = "btc"
+    session["flags"]["is_new_user"] = False
+
+
+def use_session(manager: StateManager, user_id: str) -> None:
+    manager.set_last_intent(user_id, "fees")
+    manager.set_entity(user_id, "cryptocurrency", "btc")
+    manager.set_flag(user_id, "is_new_user", False)
+
+
+def measure(build, count: int) -> float:
+    """Bytes allocated per session by build(user_ids)"""
+    user_ids = [f"user-{i}" for i in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = build(user_ids)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del sessions
+    return (after - before) / count
+
+
+def build_legacy(user_ids, used=False):
+    sessions = {}
+    for user_id in user_ids:
+        sessions[user_id] = session = legacy_session()
+        if used:
+            use_legacy(session)
+    return sessions
+
+
+def build_compact(user_ids, used=False):
+    manager = StateManager()
+    for user_id in user_ids:
+        manager.create_session(user_id)
+        if used:
+            use_session(manager, user_id)
+    return manager
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print(f"{'':24}{'dict layout':>14}{'Session':>14}")
+    for label, used in (("new session", False), ("intent, entity, flag", True)):
+        legacy = measure(lambda ids: build_legacy(ids, used), count)
+        compact = measure(lambda ids: build_compact(ids, used), count)
+        print(f"{label:24}{legacy:>12.0f} B{compact:>12.0f} B")
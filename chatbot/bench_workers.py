@@ -0,0 +1,69 @@
+"""
+Measure how WorkerPool throughput scales with the number of workers
+
+For each bot, answers the same messages in-process and then on pools of 1 to N
+workers, and reports messages per second and the memory each worker doesn't
+share with the others (from /proc, Linux only).
+Run with: python bench_workers.py [max workers] [messages]
+"""
+import os
+import sys
+import time
+import random
+
+from loadgen import SAMPLE_MESSAGES
+from workers import WorkerPool, HANDLER_FACTORIES, engine_handler
+
+BATCH_SIZE = 256
+
+# The in-process measurements run in the parent, which must not start threads before
+# the pools fork, so the engine is built without its session sweeper there
+IN_PROCESS_FACTORIES = dict(HANDLER_FACTORIES, engine=lambda: engine_handler(sweep_interval=None))
+
+
+def make_messages(count: int, users: int = 1000):
+    rng = random.Random(0)
+    return [(f"user-{rng.randrange(users)}", rng.choice(SAMPLE_MESSAGES)) for _ in range(count)]
+
+
+def private_kb(pid: int) -> int:
+    """Private (unshared) memory of a process in kB, 0 where /proc isn't available"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            next(f)  # Address range of the rollup
+            fields = dict(line.split(":", 1) for line in f)
+    except OSError:
+        return 0
+    return sum(int(fields.get(name, "0 kB").split()[0]) for name in ("Private_Clean", "Private_Dirty"))
+
+
+def run_batches(process_batch, messages) -> float:
+    """Messages per second answering messages in batches"""
+    start = time.perf_counter()
+    for offset in range(0, len(messages), BATCH_SIZE):
+        process_batch(messages[offset:offset + BATCH_SIZE])
+    return len(messages) / (time.perf_counter() - start)
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else max(2, len(os.sched_getaffinity(0)))
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    messages = make_messages(count)
+    print(f"{len(os.sched_getaffinity(0))} CPUs available, {count} messages in batches of {BATCH_SIZE}")
+
+    for bot, factory in HANDLER_FACTORIES.items():
+        handler = IN_PROCESS_FACTORIES[bot]()
+        rate = run_batches(lambda batch: [handler(user_id, text) for user_id, text in batch], messages)
+        print(f"{bot:>6} in-process: {rate:10,.0f} msgs/sec")
+        for workers in range(1, max_workers + 1):
+            for freeze in (True, False):
+                with WorkerPool(factory, workers, freeze=freeze) as pool:
+                    rate = run_batches(pool.process_batch, messages)
+                    private = sum(private_kb(pid) for pid in pool.pids) / workers
+                print(f"{bot:>6} {workers} worker{'s' if workers > 1 else ' '} "
+                      f"{'frozen  ' if freeze else 'unfrozen'}: {rate:10,.0f} msgs/sec, "
+                      f"{private:8,.0f} kB private per worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List, Tuple, Any, NamedTuple, Optional, Union
+
+from knowledge_base import KnowledgeBase
+from statemanager import StateManager, PatternMatcher, ResponseGenerator
+
+# Flow started when the user asks to open an account
+REGISTRATION_FLOW = "account_registration"
+
+# Kept in the history instead of answers to flow steps that must not be stored, like passwords
+REDACTED = "[redacted]"
+
+# A message matching an intent at least this confidently leaves the flow the user is in,
+# so "help" or "bye" isn't taken for an answer. Not applied to steps asking for secrets.
+FLOW_EXIT_CONFIDENCE = 0.5
+
+
+class TurnResult(NamedTuple):
+    """Outcome of handling one user message"""
+    intent: str
+    confidence: float
+    entities: Dict[str, Any]
+    response: str
+
+
+class ConversationEngine:
+    """
+    Runs complete conversation turns on top of StateManager, PatternMatcher and ResponseGenerator
+
+    process() handles a message synchronously. handle() does the same from asyncio:
+    messages of one user are processed one at a time and in arrival order, at most
+    max_concurrency turns run at once, and the turns themselves run on an executor so
+    pattern matching never blocks the event loop.
+    """
+
+    def __init__(self, state_manager: StateManager = None, matcher: PatternMatcher = None,
+                 generator: ResponseGenerator = None, knowledge_base: KnowledgeBase = None,
+                 max_concurrency: int = 64, executor: Executor = None):
+        """
+        Args:
+            state_manager: Session state, a new in-memory StateManager if omitted
+            matcher: Intent matcher, built on knowledge_base if omitted
+            generator: Response generator, built on knowledge_base if omitted
+            knowledge_base: Knowledge base for a matcher and generator created here
+            max_concurrency: Maximum number of turns processed at the same time
+            executor: Executor turns run on, a thread pool of max_concurrency threads if omitted
+        """
+        if matcher is None or generator is None:
+            knowledge_base = knowledge_base or (matcher.kb if matcher is not None else KnowledgeBase())
+        self.state = state_manager or StateManager()
+        self.matcher = matcher or PatternMatcher(knowledge_base)
+        self.generator = generator or ResponseGenerator(knowledge_base)
+        self.max_concurrency = max_concurrency
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # user id -> [lock, number of messages holding or waiting for it]
+        self._user_locks: Dict[str, list] = {}
+
+    def process(self, user_id: str, text: str) -> TurnResult:
+        """
+        Handle one user message: update the session and generate the response
+
+        Args:
+            user_id: The user the message is from
+            text: The message
+
+        Returns:
+            The detected intent and entities, and the response
+        """
+        state = self.state
+        matcher = self.matcher
+        session = state.turn(user_id)
+        context = session.current_context
+
+        flows = self.generator.flows
+        logged_text = text
+        in_flow = context is not None and context in flows and session.in_flow(context)
+        if in_flow and not flows.expects_secret(session, context):
+            intent, confidence = matcher.match_intent(text, context)
+            if intent != "unknown" and confidence >= FLOW_EXIT_CONFIDENCE:
+                flows.cancel(session, context)
+                context = session.current_context
+                in_flow = False
+
+        if in_flow:
+            intent, confidence, entities = context, 1.0, {}
+            result = flows.advance(session, context, text)
+            response = result.response
+            if result.sensitive:
+                logged_text = REDACTED
+        else:
+            intent, confidence = matcher.match_intent(text, context)
+            entities = matcher.extract_entities(text)
+            for entity_type, value in entities.items():
+                session.set_entity(entity_type, value)
+
+            if intent == "create_account":
+                response = flows.start(session, REGISTRATION_FLOW)
+            else:
+                kb_info = matcher.get_knowledge_base_info(intent)
+                response = self.generator.get_response(intent, entities, kb_info, context)
+
+        session.set_last_intent(intent)
+        session.add_history(logged_text, response, state.history_size, state.history_path(user_id))
+        return TurnResult(intent, confidence, entities, response)
+
+    def process_batch(self, messages: List[Tuple[str, str]]) -> List[Union[TurnResult, Exception]]:
+        """
+        Handle (user_id, text) messages in order
+
+        One call per batch saves the per-message executor round trip, and repeated
+        texts in a batch hit the matcher's caches. A message that fails doesn't stop
+        the others: its position holds the exception it raised instead of a result.
+        """
+        process = self.process
+        results: List[Union[TurnResult, Exception]] = []
+        for user_id, text in messages:
+            try:
+                results.append(process(user_id, text))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def handle(self, user_id: str, text: str) -> TurnResult:
+        """
+        Handle one user message from asyncio
+
+        Messages of the same user are processed in the order handle() was called for
+        them. A user waiting for their previous message doesn't take up a
+        concurrency slot.
+        """
+        user_locks = self._user_locks
+        entry = user_locks.get(user_id)
+        if entry is None:
+            entry = user_locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+
+        try:
+            async with entry[0]:
+                async with self._get_semaphore():
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._get_executor(), self.process, user_id, text)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del user_locks[user_id]
+
+    async def handle_batch(self, messages: List[Tuple[str, str]]) -> List[Union[TurnResult, Exception]]:
+        """
+        Handle (user_id, text) messages in order with a single executor call, see process_batch
+
+        Unlike handle(), this doesn't order the batch against other calls, the caller
+        has to make sure batches containing the same user don't overlap.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), self.process_batch, messages)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created on first use, inside the event loop that will use it
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix="conversation")
+        return self._executor
+
+    def close(self) -> None:
+        """Shut down the executor if the engine created it"""
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
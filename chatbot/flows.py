@@ -0,0 +1,220 @@
+import re
+from typing import Dict, Tuple, Any, Optional, Callable, NamedTuple, Iterable, FrozenSet
+
+from session import Session
+
+
+class FlowStep(NamedTuple):
+    """One question of a multi-step flow"""
+    field: str  # Name the answer is stored under, also used to refer to the step
+    prompt: str
+    # Turns the answer into the stored value, raises ValueError if it isn't acceptable
+    validate: Optional[Callable[[str], Any]] = None
+    invalid: str = "Sorry, I couldn't use that. Could you try again?"
+    store: bool = True  # False for answers that must not be kept, like passwords
+    next: Optional[str] = None  # Field of the step that follows, the next one in order if omitted
+
+
+# Answers that leave a flow at any step
+CANCEL_WORDS = frozenset({"cancel", "stop", "quit", "exit", "abort", "never mind", "nevermind"})
+
+
+class Flow(NamedTuple):
+    """Declarative definition of a multi-step conversation flow"""
+    name: str
+    steps: Tuple[FlowStep, ...]
+    completion: str  # Response once the last step is answered
+    cancelled: str = "Okay, I've stopped here. Let me know if there's anything else I can help with."
+    cancel_words: FrozenSet[str] = CANCEL_WORDS
+
+
+class CompiledFlow(NamedTuple):
+    """A flow turned into a state table indexed by step number"""
+    name: str
+    fields: Tuple[str, ...]
+    prompts: Tuple[str, ...]
+    validators: Tuple[Optional[Callable[[str], Any]], ...]
+    invalid: Tuple[str, ...]
+    store: Tuple[bool, ...]
+    # Step number -> number of the next step, len(fields) when the flow is complete
+    transitions: Tuple[int, ...]
+    completion: str
+    cancelled: str
+    cancel_words: FrozenSet[str]
+
+
+class FlowResult(NamedTuple):
+    """Outcome of answering a flow step"""
+    response: str
+    done: bool
+    data: Dict[str, Any]  # Answers collected so far
+    # The message answered a step with store=False and must not be kept anywhere, e.g. in history
+    sensitive: bool = False
+    cancelled: bool = False  # The message left the flow before it was complete
+
+
+def compile_flow(flow: Flow) -> CompiledFlow:
+    """
+    Compile a flow definition into a state table
+
+    Raises:
+        ValueError: If the flow has no steps, repeats a field or refers to an unknown step
+    """
+    if not flow.steps:
+        raise ValueError(f"Flow '{flow.name}' has no steps")
+
+    index = {}
+    for number, step in enumerate(flow.steps):
+        if step.field in index:
+            raise ValueError(f"Flow '{flow.name}' has more than one step for '{step.field}'")
+        index[step.field] = number
+
+    transitions = []
+    for number, step in enumerate(flow.steps):
+        if step.next is None:
+            transitions.append(number + 1)
+        elif step.next in index:
+            transitions.append(index[step.next])
+        else:
+            raise ValueError(f"Step '{step.field}' of flow '{flow.name}' continues with unknown step '{step.next}'")
+
+    return CompiledFlow(
+        name=flow.name,
+        fields=tuple(step.field for step in flow.steps),
+        prompts=tuple(step.prompt for step in flow.steps),
+        validators=tuple(step.validate for step in flow.steps),
+        invalid=tuple(step.invalid for step in flow.steps),
+        store=tuple(step.store for step in flow.steps),
+        transitions=tuple(transitions),
+        completion=flow.completion,
+        cancelled=flow.cancelled,
+        cancel_words=frozenset(word.lower() for word in flow.cancel_words)
+    )
+
+
+_EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+
+def validate_email(text: str) -> str:
+    match = _EMAIL_PATTERN.search(text)
+    if not match:
+        raise ValueError("not an email address")
+    return match.group(0).lower()
+
+
+def validate_password(text: str) -> str:
+    if (len(text) < 12 or not re.search(r"[A-Za-z]", text) or not re.search(r"\d", text)
+            or not re.search(r"[^A-Za-z\d]", text)):
+        raise ValueError("weak password")
+    return text
+
+
+def validate_non_empty(text: str) -> str:
+    text = " ".join(text.split())
+    if not text:
+        raise ValueError("empty answer")
+    return text
+
+
+ACCOUNT_REGISTRATION = Flow(
+    name="account_registration",
+    steps=(
+        FlowStep("email", "I'll help you create an account! First, could you provide your email address?",
+                 validate_email, "That doesn't look like an email address. Could you check it and send it again?"),
+        FlowStep("password", "Great! Now, please create a strong password. It should be at least 12 characters with letters, numbers, and special characters.",
+                 validate_password, "That password isn't strong enough. Please use at least 12 characters with letters, numbers, and special characters.",
+                 store=False),
+        FlowStep("full_name", "Now I'll need your full name as it appears on your government-issued ID.",
+                 validate_non_empty, "Please type your full name as it appears on your ID."),
+        FlowStep("country", "Almost done! Which country do you live in? Some services are not available in restricted jurisdictions.",
+                 validate_non_empty, "Please tell me which country you live in."),
+    ),
+    completion="Your account has been created! Please check your email for a confirmation link to verify your address.",
+    cancelled="Okay, I've cancelled the account registration. Let me know if there's anything else I can help with."
+)
+
+DEFAULT_FLOWS = (ACCOUNT_REGISTRATION,)
+
+
+class FlowEngine:
+    """
+    Runs multi-step flows from their compiled state tables
+
+    A flow's state in the session is a small dict: the current step number plus the
+    answers stored so far. It only holds plain values, so it is saved with the rest
+    of the session and a flow started on one worker can continue on another.
+    """
+
+    def __init__(self, flows: Iterable[Flow] = DEFAULT_FLOWS):
+        """
+        Args:
+            flows: Flow definitions, compiled here
+        """
+        self.flows: Dict[str, CompiledFlow] = {flow.name: compile_flow(flow) for flow in flows}
+
+    def __contains__(self, flow_name: str) -> bool:
+        return flow_name in self.flows
+
+    def prompt(self, flow_name: str, flow_state: Dict) -> str:
+        """Get the question for the flow's current step, or the completion message"""
+        flow = self.flows[flow_name]
+        step = flow_state.get("step", 0)
+        return flow.prompts[step] if step < len(flow.prompts) else flow.completion
+
+    def start(self, session: Session, flow_name: str) -> str:
+        """Start a flow on the session, returning its first question"""
+        session.start_flow(flow_name, {"step": 0})
+        return self.flows[flow_name].prompts[0]
+
+    def expects_secret(self, session: Session, flow_name: str) -> bool:
+        """Whether the flow's current step asks for something that must not be kept, like a password"""
+        flow = self.flows[flow_name]
+        step = session.get_flow_state(flow_name).get("step", 0)
+        return step < len(flow.store) and not flow.store[step]
+
+    def cancel(self, session: Session, flow_name: str) -> FlowResult:
+        """End a flow before it is complete, dropping its answers"""
+        flow = self.flows[flow_name]
+        data = _answers(session.get_flow_state(flow_name))
+        session.end_flow(flow_name)
+        return FlowResult(flow.cancelled, True, data, cancelled=True)
+
+    def advance(self, session: Session, flow_name: str, text: str) -> FlowResult:
+        """
+        Take a message as the answer to the current step and move to the next one
+
+        An answer that doesn't validate leaves the flow on the same step. When the last
+        step is answered the flow is ended and the collected answers are returned. One
+        of the flow's cancel words ends it at any step.
+        """
+        flow = self.flows[flow_name]
+        state = session.get_flow_state(flow_name)
+        step = state.get("step", 0)
+        if step >= len(flow.prompts):
+            session.end_flow(flow_name)
+            return FlowResult(flow.completion, True, _answers(state))
+
+        if text.strip().strip(".!").strip().lower() in flow.cancel_words:
+            return self.cancel(session, flow_name)
+
+        value = text.strip()
+        store = flow.store[step]
+        validate = flow.validators[step]
+        if validate is not None:
+            try:
+                value = validate(value)
+            except ValueError:
+                return FlowResult(flow.invalid[step], False, _answers(state), not store)
+
+        if store:
+            state[flow.fields[step]] = value
+        step = state["step"] = flow.transitions[step]
+
+        if step >= len(flow.prompts):
+            session.end_flow(flow_name)
+            return FlowResult(flow.completion, True, _answers(state), not store)
+        return FlowResult(flow.prompts[step], False, _answers(state), not store)
+
+
+def _answers(state: Dict) -> Dict[str, Any]:
+    return {field: value for field, value in state.items() if field != "step"}
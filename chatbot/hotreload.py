@@ -0,0 +1,133 @@
+import os
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from knowledge_base import KnowledgeBase
+from statemanager import PatternMatcher, ResponseGenerator
+
+logger = logging.getLogger(__name__)
+
+FileSignature = Optional[Tuple[int, int, int]]
+
+
+def file_signature(path: Optional[str]) -> FileSignature:
+    """Get (inode, size, mtime_ns) of a file, None if there is no such file"""
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class HotReloader:
+    """
+    Watches the pattern and knowledge base files of a PatternMatcher and reloads them on change
+
+    A new knowledge base and compiled patterns are built completely on the watcher
+    thread and only then swapped in, so requests being served keep using the old
+    state until the new one is ready. A file that fails to load is logged and the
+    old state stays in place.
+
+    Files should be replaced atomically (KnowledgeBase.save already does), not
+    rewritten in place, so a half-written file is never picked up.
+    """
+
+    def __init__(self, matcher: PatternMatcher, generator: ResponseGenerator = None, interval: float = 5.0):
+        """
+        Args:
+            matcher: Matcher whose patterns_path and kb.data_path are watched
+            generator: Response generator to point at the reloaded knowledge base
+            interval: Seconds between checks when running in the background
+        """
+        self.matcher = matcher
+        self.generator = generator
+        self.interval = interval
+        self.reloads = 0
+        self.failures = 0
+        self._signatures = self._current_signatures()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _current_signatures(self) -> Dict[str, FileSignature]:
+        return {
+            "patterns": file_signature(self.matcher.patterns_path),
+            "knowledge_base": file_signature(self.matcher.kb.data_path)
+        }
+
+    def check(self) -> bool:
+        """
+        Reload if a watched file changed since the last check
+
+        Returns:
+            True if a new state was swapped in
+        """
+        with self._lock:
+            signatures = self._current_signatures()
+            changed = {name for name, signature in signatures.items() if signature != self._signatures[name]}
+            if not changed:
+                return False
+
+            # Remember the signatures even if loading fails, so a broken file is reported once
+            # and not on every check. The next change to it triggers another attempt.
+            self._signatures = signatures
+            return self._reload(reload_kb="knowledge_base" in changed)
+
+    def reload(self) -> bool:
+        """
+        Reload patterns and knowledge base now, whether or not their files changed
+
+        Returns:
+            True if a new state was swapped in
+        """
+        with self._lock:
+            self._signatures = self._current_signatures()
+            return self._reload(reload_kb=True)
+
+    def _reload(self, reload_kb: bool) -> bool:
+        old_kb = self.matcher.kb
+        try:
+            knowledge_base = None
+            if reload_kb and old_kb.data_path:
+                knowledge_base = KnowledgeBase(old_kb.data_path).preload()
+            self.matcher.reload(knowledge_base=knowledge_base)
+        except Exception as e:
+            # Anything a broken file can raise: OSError, ValueError for bad JSON, re.error for a
+            # bad pattern, KeyError/AttributeError for missing sections
+            self.failures += 1
+            logger.error("Hot reload failed, keeping the current state: %s: %s", type(e).__name__, e)
+            return False
+
+        if self.generator is not None:
+            self.generator.reload(self.matcher.kb)
+        self.reloads += 1
+        logger.info("Reloaded patterns and knowledge base version %s", self.matcher.kb.version)
+        # The old mapping isn't closed, requests that are still using it can finish; it is
+        # released once nothing refers to it anymore
+        return True
+
+    def start(self) -> None:
+        """Start checking for changes every interval seconds on a daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="kb-hot-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and wait for it to finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                # Keep watching, the next change to the files gets another attempt
+                logger.exception("Hot reload check failed")
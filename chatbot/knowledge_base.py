@@ -1,11 +1,132 @@
+import os
+import re
+import json
+import math
+import mmap
+import bisect
+import hashlib
+import tempfile
+import threading
+
+CATEGORIES = ("exchange_info", "account_management", "trading_info",
+              "wallet_operations", "technical_support", "crypto_education")
+
+# On-disk format written by KnowledgeBase.save
+FILE_FORMAT = "knowledge-base"
+FILE_FORMAT_VERSION = 1
+
+_MISSING = object()
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
 class KnowledgeBase:
-    def __init__(self):
-        self.exchange_info = self._load_exchange_info()
-        self.account_management = self._load_account_management()
-        self.trading_info = self._load_trading_info()
-        self.wallet_operations = self._load_wallet_operations()
-        self.technical_support = self._load_technical_support()
-        self.crypto_education = self._load_crypto_education()
+    def __init__(self, data_path=None):
+        """
+        Create a knowledge base. Categories are loaded on first access.
+
+        Args:
+            data_path (str, optional): File written by save(). It is memory-mapped
+                read-only, so worker processes opening the same file share its pages.
+                Without it the built-in data is used.
+        """
+        self.data_path = data_path
+        self._source = _KnowledgeBaseFile(data_path) if data_path else None
+        self.version = self._source.version if self._source else "builtin"
+        self._load_lock = threading.Lock()
+        self._path_index = {}
+        self._search_index = None  # Built on the first search
+
+    def __getattr__(self, name):
+        # Only called for missing attributes, i.e. categories that aren't loaded yet
+        if name.startswith("_") or name not in CATEGORIES:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        with self._load_lock:
+            if name not in self.__dict__:
+                data = self._load_category(name)
+                self._index_category(name, data)
+                self.__dict__[name] = data
+        return self.__dict__[name]
+
+    def _load_category(self, name):
+        """Load one category from the data file, or from the built-in data"""
+        if self._source is not None:
+            data = self._source.load(name)
+            if data is None:
+                raise AttributeError(f"Category '{name}' is not in {self.data_path}")
+            return data
+        return getattr(self, f"_load_{name}")()
+
+    def loaded_categories(self):
+        """Names of the categories that have been loaded so far"""
+        return [category for category in CATEGORIES if category in self.__dict__]
+
+    def preload(self, search_index=True):
+        """
+        Load every category and build the indexes up front, e.g. before swapping
+        this knowledge base in for another one that is serving requests.
+
+        Args:
+            search_index (bool): Also build the search index
+        """
+        for category in CATEGORIES:
+            getattr(self, category)
+        if search_index:
+            self._get_search_index()
+        return self
+
+    def save(self, path, version=None):
+        """
+        Write the knowledge base to a compact, versioned file.
+
+        The file starts with a one-line JSON header holding the format version, the
+        data version and the byte range of every category, followed by each category
+        as compact JSON. A reader can therefore map the file and parse only the
+        categories it touches. The file is replaced atomically.
+
+        Args:
+            path (str): Destination file
+            version (str, optional): Data version, defaults to a hash of the contents
+
+        Returns:
+            str: The data version written
+        """
+        sections = {}
+        blobs = []
+        offset = 0
+        digest = hashlib.sha256()
+        for category in CATEGORIES:
+            blob = json.dumps(getattr(self, category), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            sections[category] = [offset, len(blob)]
+            offset += len(blob)
+            blobs.append(blob)
+            digest.update(blob)
+
+        version = version or digest.hexdigest()[:16]
+        header = json.dumps({
+            "format": FILE_FORMAT,
+            "format_version": FILE_FORMAT_VERSION,
+            "version": version,
+            "categories": sections
+        }, separators=(",", ":")).encode("utf-8")
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".kb-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header + b"\n")
+                for blob in blobs:
+                    f.write(blob)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return version
+
+    def close(self):
+        """Release the data file mapping, loaded categories stay usable"""
+        if self._source is not None:
+            self._source.close()
         
     def _load_exchange_info(self):
         return {
@@ -438,4 +559,366 @@ class KnowledgeBase:
                 "tax_tools": ["CryptoTax", "TokenTax", "CoinTracker", "Koinly"]
             }
         }
-        
\ No newline at end of file
+
+    def _index_category(self, category, data):
+        """
+        Add every dict path of a category to the flat lookup table.
+
+        The table maps path tuples such as ("exchange_info", "fee_structure", "withdrawal")
+        to the value stored there.
+        """
+        index = self._path_index
+
+        def index_recursive(data, path):
+            index[path] = data
+            if isinstance(data, dict):
+                for key, value in data.items():
+                    index_recursive(value, path + (key,))
+
+        index_recursive(data, (category,))
+
+    def get_path(self, path, default=None):
+        """
+        Look up information by its full path in O(1).
+
+        Args:
+            path (str or tuple): Dotted path such as "exchange_info.fee_structure.withdrawal",
+                                 or a tuple of keys
+            default: Value returned if the path doesn't exist
+
+        Returns:
+            The information stored at the path, or default
+        """
+        if isinstance(path, str):
+            path = tuple(path.split("."))
+        path = tuple(path)
+
+        result = self._path_index.get(path, _MISSING)
+        if result is _MISSING and path and self._load_if_needed(path[0]):
+            result = self._path_index.get(path, _MISSING)
+        return default if result is _MISSING else result
+
+    def _load_if_needed(self, category):
+        """Load a category that hasn't been accessed yet, True if anything was loaded"""
+        if category in CATEGORIES and category not in self.__dict__:
+            return getattr(self, category, None) is not None
+        return False
+
+    def get_info(self, category, subcategory=None, topic=None, subtopic=None):
+        """
+        Retrieve information from the knowledge base.
+        
+        Args:
+            category (str): Main category (e.g., 'exchange_info', 'account_management')
+            subcategory (str, optional): Subcategory within main category
+            topic (str, optional): Specific topic within subcategory
+            subtopic (str, optional): Specific subtopic within topic
+            
+        Returns:
+            dict or str: Requested information
+        """
+        if subcategory is None:
+            path = (category,)
+        elif topic is None:
+            path = (category, subcategory)
+        elif subtopic is None:
+            path = (category, subcategory, topic)
+        else:
+            path = (category, subcategory, topic, subtopic)
+
+        result = self._path_index.get(path, _MISSING)
+        if result is _MISSING and self._load_if_needed(category):
+            result = self._path_index.get(path, _MISSING)
+        if result is not _MISSING:
+            return result
+
+        # Misses are rare, work out which part of the path is wrong the slow way
+        return self._resolve_info(category, subcategory, topic, subtopic)
+
+    def _resolve_info(self, category, subcategory=None, topic=None, subtopic=None):
+        """Walk the knowledge base step by step, describing the first missing part"""
+        if not hasattr(self, category):
+            return f"Category '{category}' not found in knowledge base."
+            
+        data = getattr(self, category)
+        
+        if subcategory is None:
+            return data
+            
+        if subcategory not in data:
+            return f"Subcategory '{subcategory}' not found in {category}."
+            
+        result = data[subcategory]
+        
+        if topic is not None:
+            if topic not in result:
+                return f"Topic '{topic}' not found in {category}.{subcategory}."
+            result = result[topic]
+            
+            if subtopic is not None:
+                if subtopic not in result:
+                    return f"Subtopic '{subtopic}' not found in {category}.{subcategory}.{topic}."
+                result = result[subtopic]
+                
+        return result
+        
+    def _build_search_index(self):
+        """
+        Flatten the knowledge base into searchable entries and index them.
+
+        Every dict key, string list item and string value becomes one entry, in the
+        same order a recursive walk visits them. Entries are indexed by character
+        trigram for substring search, and by word for ranked search.
+
+        Returns:
+            _SearchIndex: The index
+        """
+        entries = []
+        category_ranges = {}
+
+        def add_entry(path, value, text, depth):
+            entries.append((path, value, text.lower(), depth))
+
+        def flatten_recursive(data, path, depth):
+            if isinstance(data, dict):
+                for key, value in data.items():
+                    new_path = f"{path}.{key}" if path else key
+                    add_entry(new_path, value, key, depth + 1)
+                    flatten_recursive(value, new_path, depth + 1)
+            elif isinstance(data, list):
+                for i, item in enumerate(data):
+                    new_path = f"{path}[{i}]"
+                    if isinstance(item, str):
+                        add_entry(new_path, item, item, depth + 1)
+                    if isinstance(item, (dict, list)):
+                        flatten_recursive(item, new_path, depth + 1)
+            elif isinstance(data, str):
+                add_entry(path, data, data, depth)
+
+        for category in CATEGORIES:
+            start = len(entries)
+            flatten_recursive(getattr(self, category), category, 0)
+            category_ranges[category] = (start, len(entries))
+
+        return _SearchIndex(entries, category_ranges)
+
+    def _get_search_index(self):
+        if self._search_index is None:
+            self._search_index = self._build_search_index()
+        return self._search_index
+
+    def search(self, query):
+        """
+        Simple search function to find information across all categories.
+        
+        Args:
+            query (str): Search term, matched as a case-insensitive substring
+            
+        Returns:
+            list: List of matches with their paths
+        """
+        return [{"path": path, "value": value} for path, value in self.iter_search(query)]
+
+    def iter_search(self, query, limit=None, categories=None, max_depth=None):
+        """
+        Lazily yield search hits as they are found.
+
+        Nothing is collected up front: values are references into the knowledge
+        base, and scanning stops as soon as limit hits have been produced.
+
+        Args:
+            query (str): Search term, matched as a case-insensitive substring
+            limit (int, optional): Stop after this many hits
+            categories (iterable, optional): Only search these main categories
+            max_depth (int, optional): Only match keys and values at most this many
+                                       levels below their category (1 = subcategories)
+
+        Yields:
+            tuple: (path, value) for each hit, in knowledge base order
+        """
+        if limit is not None and limit <= 0:
+            return
+
+        query = query.lower()
+        index = self._get_search_index()
+        entries = index.entries
+        found = 0
+
+        for entry_id in index.substring_candidates(query, categories):
+            path, value, text, depth = entries[entry_id]
+            if max_depth is not None and depth > max_depth:
+                continue
+            if query not in text:
+                continue
+
+            yield path, value
+            found += 1
+            if limit is not None and found >= limit:
+                return
+
+    def search_ranked(self, query, limit=10):
+        """
+        Search by words and rank results by relevance (BM25).
+
+        Each query word also matches longer words it is a prefix of, so "withdr"
+        finds "withdrawal".
+
+        Args:
+            query (str): Search terms
+            limit (int, optional): Maximum number of results, None for all
+
+        Returns:
+            list: Matches with their paths and scores, best first
+        """
+        index = self._get_search_index()
+        results = []
+        for entry_id, score in index.ranked_matches(query.lower(), limit):
+            path, value, _, _ = index.entries[entry_id]
+            results.append({"path": path, "value": value, "score": score})
+        return results
+
+
+class _KnowledgeBaseFile:
+    """Read-only, memory-mapped knowledge base file written by KnowledgeBase.save"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header_end = self._map.find(b"\n")
+        try:
+            header = json.loads(self._map[:header_end]) if header_end >= 0 else {}
+        except ValueError:
+            header = {}
+        if not isinstance(header, dict) or header.get("format") != FILE_FORMAT:
+            raise ValueError(f"{path} is not a knowledge base file")
+        if header.get("format_version") != FILE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported knowledge base format version {header.get('format_version')} in {path}")
+
+        self.version = header["version"]
+        self._data_start = header_end + 1
+        self._sections = header["categories"]
+
+    def load(self, category):
+        """Parse one category, None if the file doesn't contain it"""
+        section = self._sections.get(category)
+        if section is None:
+            return None
+        offset, length = section
+        start = self._data_start + offset
+        return json.loads(self._map[start:start + length])
+
+    def close(self):
+        self._map.close()
+
+
+class _SearchIndex:
+    """Trigram and word index over flattened knowledge base entries"""
+
+    # BM25 parameters
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, entries, category_ranges):
+        self.entries = entries  # (path, value, lowercased text, depth), in walk order
+        self.category_ranges = category_ranges  # category -> (first entry id, end)
+        self.trigrams = {}      # trigram -> ascending entry ids
+        self.postings = {}      # word -> [(entry id, term frequency)]
+        self.lengths = []       # words per entry
+
+        for entry_id, (_, _, text, _) in enumerate(entries):
+            for trigram in {text[i:i + 3] for i in range(len(text) - 2)}:
+                self.trigrams.setdefault(trigram, []).append(entry_id)
+
+            words = _TOKEN_PATTERN.findall(text)
+            self.lengths.append(len(words))
+            counts = {}
+            for word in words:
+                counts[word] = counts.get(word, 0) + 1
+            for word, count in counts.items():
+                self.postings.setdefault(word, []).append((entry_id, count))
+
+        self.vocabulary = sorted(self.postings)
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def substring_candidates(self, query, categories=None):
+        """
+        Lazily yield ids of entries that may contain query, in walk order.
+
+        Candidates come from the posting list of the query's rarest trigram, so
+        they still have to be checked against the entry text.
+        """
+        if categories is None:
+            ranges = list(self.category_ranges.values())
+        else:
+            ranges = sorted(self.category_ranges[category] for category in categories
+                            if category in self.category_ranges)
+
+        if len(query) < 3:
+            # Too short for trigrams, but the texts are already lowercased
+            for start, end in ranges:
+                yield from range(start, end)
+            return
+
+        rarest = None
+        for trigram in {query[i:i + 3] for i in range(len(query) - 2)}:
+            posting = self.trigrams.get(trigram)
+            if posting is None:
+                return
+            if rarest is None or len(posting) < len(rarest):
+                rarest = posting
+
+        for start, end in ranges:
+            position = bisect.bisect_left(rarest, start)
+            while position < len(rarest) and rarest[position] < end:
+                yield rarest[position]
+                position += 1
+
+    def expand_prefix(self, prefix):
+        """Vocabulary words starting with prefix"""
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        words = []
+        for word in self.vocabulary[start:]:
+            if not word.startswith(prefix):
+                break
+            words.append(word)
+        return words
+
+    def ranked_matches(self, query, limit=None):
+        """(entry id, BM25 score) pairs for the query words, best first"""
+        total = len(self.entries)
+        scores = {}
+
+        for term in set(_TOKEN_PATTERN.findall(query)):
+            for word in self.expand_prefix(term):
+                posting = self.postings[word]
+                idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+                for entry_id, count in posting:
+                    norm = 1 - self.B + self.B * self.lengths[entry_id] / self.average_length
+                    score = idf * count * (self.K1 + 1) / (count + self.K1 * norm)
+                    scores[entry_id] = scores.get(entry_id, 0.0) + score
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit is not None else ranked
+
+# Example usage
+if __name__ == "__main__":
+    kb = KnowledgeBase()
+    
+    # Example 1: Get information about trading fees
+    print("=== Trading Fees ===")
+    trading_fees = kb.get_info("exchange_info", "fee_structure", "trading")
+    print(trading_fees)
+    print()
+    
+    # Example 2: Get information about Bitcoin deposit confirmations
+    print("=== BTC Deposit Confirmations ===")
+    btc_confirms = kb.get_info("wallet_operations", "deposits", "crypto", "confirmations_required")["BTC"]
+    print(f"Bitcoin requires {btc_confirms} confirmations")
+    print()
+    
+    # Example 3: Search for information about "2FA"
+    print("=== Search Results for '2FA' ===")
+    for i, (path, _) in enumerate(kb.iter_search("2FA", limit=3)):  # Stops after the first 3 results
+        print(f"Result {i+1}: {path}")
+    print(f"Total results: {sum(1 for _ in kb.iter_search('2FA'))}")
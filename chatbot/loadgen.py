@@ -0,0 +1,118 @@
+"""
+Load generator for server.py
+
+Opens keep-alive connections to the chat server, sends /chat requests on all of
+them concurrently and reports latency percentiles and messages per second.
+Run with: python loadgen.py [--spawn] [--connections N] [--requests N]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from typing import List
+
+SAMPLE_MESSAGES = [
+    "hello",
+    "what are the trading hours",
+    "do you support sol",
+    "what are your fees",
+    "what is the withdrawal fee for btc",
+    "how do i verify my account",
+    "i forgot my password",
+    "how do i deposit eth",
+    "what is a limit order",
+    "thanks",
+    "can i talk to a human",
+    "what is bitcoin",
+]
+
+
+async def run_connection(host: str, port: int, requests: int, users: int, latencies: List[float]) -> None:
+    """Send requests one after another over a single keep-alive connection"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            body = json.dumps({
+                "user_id": f"user-{random.randrange(users)}",
+                "message": random.choice(SAMPLE_MESSAGES)
+            }).encode("utf-8")
+            request = (f"POST /chat HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                       f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body
+
+            start = time.perf_counter()
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.decode("latin-1").split("\r\n")[1:]:
+                name, _, value = line.partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+
+            if not head.startswith(b"HTTP/1.1 200"):
+                raise RuntimeError(f"Unexpected response: {head.splitlines()[0].decode('latin-1')}")
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run(host: str, port: int, connections: int, requests: int, users: int) -> None:
+    latencies: List[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_connection(host, port, requests, users, latencies) for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{len(latencies)} messages over {connections} connections in {elapsed:.2f}s")
+    print(f"throughput: {len(latencies) / elapsed:,.0f} msgs/sec")
+    print(f"latency p50: {percentile(latencies, 0.50) * 1000:.2f} ms, "
+          f"p99: {percentile(latencies, 0.99) * 1000:.2f} ms, max: {latencies[-1] * 1000:.2f} ms")
+
+
+async def wait_for_port(host: str, port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure chat server latency and throughput")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--connections", type=int, default=50, help="Concurrent keep-alive connections")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per connection")
+    parser.add_argument("--users", type=int, default=1000, help="Number of distinct user ids")
+    parser.add_argument("--spawn", action="store_true", help="Start server.py in a subprocess for the run")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.spawn:
+        server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+        server = subprocess.Popen([sys.executable, server_script, "--host", args.host, "--port", str(args.port)])
+    try:
+        if server is not None:
+            asyncio.run(wait_for_port(args.host, args.port))
+        asyncio.run(run(args.host, args.port, args.connections, args.requests, args.users))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
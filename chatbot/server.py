@@ -0,0 +1,421 @@
+"""
+HTTP and WebSocket front-end for the conversation engine
+
+    POST /chat    {"user_id": "...", "message": "..."} -> {"response": "...", "intent": "...", "confidence": ...}
+    GET  /ws      WebSocket, each text frame is a /chat request body and gets its response back
+    GET  /health  "ok"
+
+HTTP/1.1 connections are kept alive. Messages arriving at about the same time are
+handed to the engine in micro-batches, one executor call per batch instead of one
+per message. Sessions inactive for --max-session-age hours are removed every
+--sweep-interval seconds. With --workers N the messages are answered by a pool of N forked
+processes instead, see workers.py. Run with:
+python server.py [--host HOST] [--port PORT] [--workers N] [--bot engine|rules]
+"""
+import json
+import base64
+import struct
+import asyncio
+import hashlib
+import logging
+import functools
+import argparse
+from collections import deque
+from http import HTTPStatus
+from typing import Dict, List, Tuple, Optional
+
+from engine import ConversationEngine, TurnResult
+from workers import WorkerPool, HANDLER_FACTORIES, engine_handler
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 64 * 1024
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class MicroBatcher:
+    """
+    Collects messages from concurrent requests and processes them in batches
+
+    A batch is started as soon as max_batch messages are waiting, or max_delay
+    seconds after the first one arrived. Batches run one after another in arrival
+    order, so the messages of one user keep their order.
+    """
+
+    def __init__(self, engine: ConversationEngine, max_batch: int = 64, max_delay: float = 0.002):
+        """
+        Args:
+            engine: Engine whose handle_batch answers the messages, with a result or exception per message
+            max_batch: Maximum number of messages per batch
+            max_delay: Seconds to wait for a batch to fill up
+        """
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.messages = 0
+        self._pending: deque = deque()  # (user_id, text, future)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start processing batches, must be called from the event loop"""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop processing batches, messages still waiting are cancelled"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._pending:
+            self._pending.popleft()[2].cancel()
+
+    async def submit(self, user_id: str, text: str) -> TurnResult:
+        """Process a message in the next batch"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((user_id, text, future))
+        self._wakeup.set()
+        return await future
+
+    async def _run(self) -> None:
+        pending = self._pending
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not pending:
+                continue
+
+            if len(pending) < self.max_batch:
+                await asyncio.sleep(self.max_delay)
+
+            batch = [pending.popleft() for _ in range(min(len(pending), self.max_batch))]
+            if pending:
+                self._wakeup.set()
+
+            messages = [(user_id, text) for user_id, text, _ in batch]
+            try:
+                results = await self.engine.handle_batch(messages)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.messages += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                # A message that failed only fails its own request
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+class HTTPError(Exception):
+    """Error answered with an HTTP status"""
+
+    def __init__(self, status: HTTPStatus, message: str = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+class ChatServer:
+    """Asyncio HTTP/1.1 and WebSocket server for a ConversationEngine"""
+
+    def __init__(self, engine: ConversationEngine = None, host: str = "127.0.0.1", port: int = 8080,
+                 max_batch: int = 64, max_delay: float = 0.002, sweep_interval: Optional[float] = 60.0,
+                 max_session_age: float = 24):
+        """
+        Args:
+            engine: Engine answering the messages, a default one if omitted; a WorkerPool also works
+            host: Address to listen on
+            port: Port to listen on, 0 picks a free one
+            max_batch: Maximum number of messages per batch
+            max_delay: Seconds to wait for a batch to fill up
+            sweep_interval: Seconds between removals of expired sessions while serving, None to
+                not run the engine's session sweeper (a WorkerPool's workers run their own)
+            max_session_age: Hours of inactivity after which a session is removed
+        """
+        self._owns_engine = engine is None
+        self.engine = engine or ConversationEngine()
+        self.host = host
+        self.port = port
+        self.sweep_interval = sweep_interval
+        self.max_session_age = max_session_age
+        self.batcher = MicroBatcher(self.engine, max_batch, max_delay)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def start(self) -> None:
+        state = getattr(self.engine, "state", None)
+        if state is not None and self.sweep_interval:
+            state.start_sweeper(self.sweep_interval, self.max_session_age)
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections see end of file and finish their handlers
+            for writer in self._connections.values():
+                writer.close()
+            if self._connections:
+                await asyncio.wait(list(self._connections))
+            await self._server.wait_closed()
+            self._server = None
+        await self.batcher.stop()
+
+        state = getattr(self.engine, "state", None)
+        if state is not None:
+            if self._owns_engine:
+                state.close()
+            else:
+                # The engine's store belongs to whoever passed the engine in
+                state.stop_sweeper()
+                state.flush()
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break  # Connection closed, or headers too large
+
+                try:
+                    method, path, version, headers = _parse_head(head)
+                except HTTPError as e:
+                    self._write_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+
+                keep_alive = _keep_alive(version, headers)
+                if path.split("?", 1)[0] == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._handle_websocket(reader, writer, headers)
+                    break
+
+                try:
+                    body = await self._read_body(reader, headers)
+                except asyncio.IncompleteReadError:
+                    break  # Connection closed before the whole body arrived
+                except HTTPError as e:
+                    # The body wasn't read, so the connection can't be reused
+                    self._write_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+
+                try:
+                    status, payload = await self._route(method, path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception:
+                    logger.exception("Error answering %s %s", method, path)
+                    status = HTTPStatus.INTERNAL_SERVER_ERROR
+                    payload = {"error": status.phrase}
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            del self._connections[task]
+            writer.close()
+
+    async def _read_body(self, reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        return await reader.readexactly(length) if length else b""
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[HTTPStatus, object]:
+        path = path.split("?", 1)[0]
+        if path == "/chat":
+            if method != "POST":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            return HTTPStatus.OK, await self._chat(body)
+        if path == "/health":
+            return HTTPStatus.OK, "ok"
+        raise HTTPError(HTTPStatus.NOT_FOUND)
+
+    async def _chat(self, body: bytes) -> Dict:
+        """Answer a /chat request body"""
+        try:
+            request = json.loads(body)
+            user_id, message = request["user_id"], request["message"]
+        except (ValueError, TypeError, KeyError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Expected {"user_id": ..., "message": ...}')
+        if not isinstance(user_id, str) or not isinstance(message, str):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "user_id and message must be strings")
+
+        result = await self.batcher.submit(user_id, message)
+        return {"response": result.response, "intent": result.intent, "confidence": result.confidence}
+
+    def _write_response(self, writer: asyncio.StreamWriter, status: HTTPStatus, payload: object,
+                        keep_alive: bool) -> None:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body)
+
+    async def _handle_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                headers: Dict[str, str]) -> None:
+        key = headers.get("sec-websocket-key")
+        if not key:
+            self._write_response(writer, HTTPStatus.BAD_REQUEST, {"error": "Missing Sec-WebSocket-Key"}, False)
+            return
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+
+        while True:
+            try:
+                opcode, payload = await _read_frame(reader)
+            except (asyncio.IncompleteReadError, HTTPError):
+                return
+
+            if opcode == 0x1:  # Text
+                try:
+                    response = await self._chat(payload)
+                except HTTPError as e:
+                    response = {"error": str(e)}
+                except Exception:
+                    logger.exception("Error answering a WebSocket message")
+                    response = {"error": HTTPStatus.INTERNAL_SERVER_ERROR.phrase}
+                writer.write(_frame(0x1, json.dumps(response, ensure_ascii=False).encode("utf-8")))
+            elif opcode == 0x9:  # Ping
+                writer.write(_frame(0xA, payload))
+            elif opcode == 0x8:  # Close
+                writer.write(_frame(0x8, payload[:2]))
+                await writer.drain()
+                return
+            elif opcode != 0xA:
+                # Binary and fragmented messages aren't supported
+                writer.write(_frame(0x8, struct.pack("!H", 1003)))
+                await writer.drain()
+                return
+            await writer.drain()
+
+
+def _parse_head(head: bytes) -> Tuple[str, str, str, Dict[str, str]]:
+    """Split a request head into method, path, version and lowercased headers"""
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, path, version = lines[0].split(" ")
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    return method, path, version, headers
+
+
+def _keep_alive(version: str, headers: Dict[str, str]) -> bool:
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.1":
+        return connection != "close"
+    return connection == "keep-alive"
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Read a complete, unfragmented WebSocket frame from a client"""
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    if not first & 0x80:
+        return 0x0, b""  # Fragmented, rejected by the caller
+
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    if length > MAX_BODY_SIZE:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+    # Client frames are always masked
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return opcode, payload
+
+
+def _frame(opcode: int, payload: bytes) -> bytes:
+    """Build an unmasked server-to-client WebSocket frame"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the chatbot over HTTP and WebSocket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--batch-size", type=int, default=64, help="Maximum messages per batch")
+    parser.add_argument("--batch-delay", type=float, default=0.002, help="Seconds to wait for a batch to fill")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Answer messages on this many forked worker processes, 0 to answer them in-process")
+    parser.add_argument("--bot", choices=sorted(HANDLER_FACTORIES), default="engine",
+                        help="Bot the workers run (--workers only)")
+    parser.add_argument("--sweep-interval", type=float, default=60.0,
+                        help="Seconds between removals of expired sessions, 0 to keep sessions forever")
+    parser.add_argument("--max-session-age", type=float, default=24.0,
+                        help="Hours of inactivity after which a session is removed")
+    args = parser.parse_args(argv)
+
+    pool = None
+    if args.workers:
+        factory = HANDLER_FACTORIES[args.bot]
+        if factory is engine_handler:
+            factory = functools.partial(engine_handler, args.sweep_interval or None, args.max_session_age)
+        # The pool forks, so it has to exist before the event loop does
+        pool = WorkerPool(factory, args.workers)
+    server = ChatServer(pool, host=args.host, port=args.port, max_batch=args.batch_size,
+                        max_delay=args.batch_delay, sweep_interval=args.sweep_interval or None,
+                        max_session_age=args.max_session_age)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import sys
+import json
+import time
+import datetime
+from typing import Dict, List, Any, Optional, NamedTuple, Iterator, Union
+
+# Flags every new session starts with. Sessions share this dict until they set a flag.
+DEFAULT_FLAGS = {
+    "needs_human": False,
+    "has_pending_query": False,
+    "is_new_user": True
+}
+
+
+def _intern(name: Optional[str]) -> Optional[str]:
+    """Intern a flag, intent or context name so every session shares one copy"""
+    return sys.intern(name) if type(name) is str else name
+
+
+class HistoryEntry(NamedTuple):
+    """One message exchange of a conversation"""
+    timestamp: float  # Epoch seconds
+    user_message: str
+    bot_response: str
+
+
+class HistoryBuffer:
+    """
+    Fixed-capacity ring buffer of the latest message exchanges
+
+    Once full, each new entry overwrites the oldest one in place. With a spill_path
+    the overwritten entries are appended to that JSON-lines file first, so the whole
+    transcript is kept without holding it in memory.
+    """
+
+    __slots__ = ("maxlen", "spill_path", "_entries", "_start")
+
+    def __init__(self, maxlen: int, spill_path: str = None):
+        """
+        Args:
+            maxlen: Number of entries kept in memory
+            spill_path: File older entries are appended to, None to drop them
+        """
+        self.maxlen = maxlen
+        self.spill_path = spill_path
+        self._entries: List[HistoryEntry] = []
+        self._start = 0  # Index of the oldest entry once the buffer is full
+
+    def append(self, entry: HistoryEntry) -> None:
+        entries = self._entries
+        if len(entries) < self.maxlen:
+            entries.append(entry)
+            return
+        if not entries:
+            return
+
+        start = self._start
+        if self.spill_path:
+            spill_history(self.spill_path, (entries[start],))
+        entries[start] = entry
+        self._start = (start + 1) % self.maxlen
+
+    def spill(self) -> None:
+        """Move every entry in memory to the spill file"""
+        if self.spill_path and self._entries:
+            spill_history(self.spill_path, self)
+        self.clear()
+
+    def clear(self) -> None:
+        self._entries = []
+        self._start = 0
+
+    def __iter__(self) -> Iterator[HistoryEntry]:
+        entries, start = self._entries, self._start
+        yield from entries[start:]
+        yield from entries[:start]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[HistoryEntry, List[HistoryEntry]]:
+        if isinstance(index, slice):
+            return list(self)[index]
+        length = len(self._entries)
+        if not -length <= index < length:
+            raise IndexError("history index out of range")
+        return self._entries[(self._start + index % length) % length]
+
+
+def spill_history(path: str, entries) -> None:
+    """Append history entries to a JSON-lines transcript file"""
+    with open(path, "a", encoding="utf-8") as f:
+        f.writelines(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n" for entry in entries)
+
+
+def read_spilled_history(path: str) -> List[HistoryEntry]:
+    """Read the entries written by spill_history, an empty list if there is no file"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [HistoryEntry(*json.loads(line)) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+class Session:
+    """
+    State of a single user's conversation
+
+    Sessions are kept for every active user, so they are stored compactly: fixed
+    slots instead of a dict, epoch-second floats instead of datetime objects, and the
+    dicts/lists that most sessions never use are only created on first write.
+
+    Mapping-style access (session["flags"], session.get("last_intent")) is kept for
+    code written against the old dict layout.
+    """
+
+    __slots__ = ("created_at", "last_active", "conversation_history", "current_context", "context_data",
+                 "entity_memory", "preferences", "verification_level", "last_intent", "_flags",
+                 "flow_states")
+
+    def __init__(self, now: float = None):
+        """
+        Args:
+            now: Creation time in epoch seconds, the current time if omitted
+        """
+        now = time.time() if now is None else now
+        self.created_at = now
+        self.last_active = now
+        self.conversation_history = None  # HistoryBuffer, created on the first message
+        self.current_context = None
+        self.context_data = None  # Dict, created when data is stored for a context
+        self.entity_memory = None
+        self.preferences = None
+        self.verification_level = "unknown"
+        self.last_intent = None
+        self._flags = None  # None while all flags have their default value
+        self.flow_states = None  # Active flows in the order they were started, with their state
+
+    def __enter__(self) -> "Session":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    @property
+    def flags(self) -> Dict[str, bool]:
+        """The session's own flags dict, created from the defaults on first access"""
+        if self._flags is None:
+            self._flags = dict(DEFAULT_FLAGS)
+        return self._flags
+
+    def get_flag(self, flag_name: str) -> bool:
+        flags = self._flags if self._flags is not None else DEFAULT_FLAGS
+        return flags.get(flag_name, False)
+
+    def set_flag(self, flag_name: str, value: bool) -> None:
+        self.flags[_intern(flag_name)] = value
+
+    def set_context(self, context: Optional[str], data: Dict = None) -> None:
+        self.current_context = _intern(context)
+        if data:
+            if self.context_data is None:
+                self.context_data = {}
+            self.context_data[self.current_context] = data
+
+    def set_entity(self, entity_type: str, entity_value: Any) -> None:
+        if self.entity_memory is None:
+            self.entity_memory = {}
+        self.entity_memory[_intern(entity_type)] = entity_value
+
+    def get_entity(self, entity_type: str) -> Any:
+        return self.entity_memory.get(entity_type) if self.entity_memory else None
+
+    def set_preference(self, preference: str, value: Any) -> None:
+        if self.preferences is None:
+            self.preferences = {}
+        self.preferences[_intern(preference)] = value
+
+    def get_preference(self, preference: str, default: Any = None) -> Any:
+        return self.preferences.get(preference, default) if self.preferences else default
+
+    def set_last_intent(self, intent: Optional[str]) -> None:
+        self.last_intent = _intern(intent)
+
+    def add_history(self, user_message: str, bot_response: str, max_length: int, spill_path: str = None,
+                    now: float = None) -> None:
+        """
+        Add a message exchange, timestamped with last_active unless now is given
+
+        max_length and spill_path configure the history buffer when it is created on
+        the first message.
+        """
+        if self.conversation_history is None:
+            self.conversation_history = HistoryBuffer(max_length, spill_path)
+        self.conversation_history.append(
+            HistoryEntry(self.last_active if now is None else now, user_message, bot_response))
+
+    @property
+    def active_flows(self) -> List[str]:
+        """Names of the active flows, in the order they were started"""
+        return list(self.flow_states) if self.flow_states else []
+
+    def in_flow(self, flow_name: str) -> bool:
+        return bool(self.flow_states) and flow_name in self.flow_states
+
+    def start_flow(self, flow_name: str, initial_state: Dict = None) -> None:
+        if self.flow_states is None:
+            self.flow_states = {}
+        self.flow_states[_intern(flow_name)] = initial_state or {"step": 0}
+        self.set_context(flow_name)
+
+    def update_flow_state(self, flow_name: str, state_updates: Dict) -> None:
+        if self.flow_states and flow_name in self.flow_states:
+            self.flow_states[flow_name].update(state_updates)
+
+    def get_flow_state(self, flow_name: str) -> Dict:
+        return self.flow_states.get(flow_name, {}) if self.flow_states else {}
+
+    def end_flow(self, flow_name: str) -> None:
+        if self.flow_states and flow_name in self.flow_states:
+            del self.flow_states[flow_name]
+
+        # If this was the current context, reset it
+        if self.current_context == flow_name:
+            self.set_context(None)
+
+    def to_record(self) -> list:
+        """The session as a list of plain values, for compact serialization"""
+        history = [list(entry) for entry in self.conversation_history] if self.conversation_history else None
+        return [self.created_at, self.last_active, history, self.current_context, self.context_data,
+                self.entity_memory, self.preferences, self.verification_level, self.last_intent, self._flags,
+                self.active_flows or None, self.flow_states]
+
+    @classmethod
+    def from_record(cls, record: list, history_size: int, spill_path: str = None) -> "Session":
+        """
+        Rebuild a session from to_record output
+
+        Args:
+            record: Values returned by to_record
+            history_size: Capacity of the restored history buffer
+            spill_path: Spill file of the restored history buffer
+        """
+        (created_at, last_active, history, current_context, context_data, entity_memory, preferences,
+         verification_level, last_intent, flags, active_flows, flow_states) = record
+
+        session = cls(created_at)
+        session.last_active = last_active
+        if history:
+            session.conversation_history = HistoryBuffer(history_size, spill_path)
+            for entry in history:
+                session.conversation_history.append(HistoryEntry(*entry))
+        session.current_context = _intern(current_context)
+        session.context_data = context_data
+        session.entity_memory = entity_memory
+        session.preferences = preferences
+        session.verification_level = verification_level
+        session.last_intent = _intern(last_intent)
+        session._flags = flags
+        # active_flows is kept in the record for older readers, it is the keys of flow_states
+        session.flow_states = {_intern(name): state for name, state in flow_states.items()} if flow_states else None
+        return session
+
+    # Mapping-style access, matching the dict sessions used to be
+
+    _KEYS = ("created_at", "last_active", "conversation_history", "current_context", "context_data",
+             "entity_memory", "preferences", "verification_level", "last_intent", "flags",
+             "active_flows", "flow_states")
+    _EMPTY_DICTS = frozenset(("context_data", "entity_memory", "preferences", "flow_states"))
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._KEYS:
+            raise KeyError(key)
+        if key in ("created_at", "last_active"):
+            return datetime.datetime.fromtimestamp(getattr(self, key))
+
+        if key == "active_flows":
+            return self.active_flows
+
+        # Materialize lazily created containers, callers of the dict layout mutate them in place
+        if getattr(self, key) is None:
+            if key in self._EMPTY_DICTS:
+                setattr(self, key, {})
+            elif key == "conversation_history":
+                return []
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "context_data" and self.context_data is None:
+            return default
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._KEYS and (key != "context_data" or self.context_data is not None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The session in the old dict layout"""
+        session = {key: self[key] for key in self._KEYS if key != "context_data"}
+        if self.context_data is not None:
+            session["context_data"] = self.context_data
+        return session
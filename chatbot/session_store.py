@@ -0,0 +1,191 @@
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from urllib.parse import quote
+from typing import Dict, Tuple, Optional, Iterable
+
+from session import Session
+
+# Version of the serialized record layout, stored as the first element
+RECORD_VERSION = 1
+
+
+def encode_session(session: Session) -> bytes:
+    """Serialize a session to compact JSON"""
+    return json.dumps([RECORD_VERSION] + session.to_record(), ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def decode_session(data: bytes, history_size: int, spill_path: str = None) -> Session:
+    """
+    Deserialize a session written by encode_session
+
+    Args:
+        data: Serialized session
+        history_size: Capacity of the restored history buffer
+        spill_path: Spill file of the restored history buffer
+    """
+    record = json.loads(data)
+    if not record or record[0] != RECORD_VERSION:
+        raise ValueError(f"Unsupported session record version: {record[0] if record else None}")
+    return Session.from_record(record[1:], history_size, spill_path)
+
+
+class SessionStore(ABC):
+    """
+    Storage backend for serialized sessions
+
+    StateManager keeps the sessions it is working with in memory and only goes to
+    the store for users it doesn't have yet and to write back changed sessions, so
+    backends can favour batched writes over fast single ones.
+    """
+
+    @abstractmethod
+    def load(self, user_id: str) -> Optional[bytes]:
+        """Get a user's serialized session, None if it isn't stored"""
+
+    @abstractmethod
+    def save_many(self, items: Iterable[Tuple[str, float, bytes]]) -> None:
+        """Store (user_id, last_active, data) entries, replacing existing ones"""
+
+    @abstractmethod
+    def delete_expired(self, cutoff: float) -> int:
+        """Remove sessions last active before the epoch-seconds cutoff, returns how many"""
+
+    def close(self) -> None:
+        """Release the backend's resources"""
+
+
+class MemorySessionStore(SessionStore):
+    """Keeps serialized sessions in a dict of this process"""
+
+    def __init__(self):
+        self._sessions: Dict[str, Tuple[float, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id: str) -> Optional[bytes]:
+        entry = self._sessions.get(user_id)
+        return entry[1] if entry is not None else None
+
+    def save_many(self, items: Iterable[Tuple[str, float, bytes]]) -> None:
+        with self._lock:
+            for user_id, last_active, data in items:
+                self._sessions[user_id] = (last_active, data)
+
+    def delete_expired(self, cutoff: float) -> int:
+        with self._lock:
+            expired = [user_id for user_id, (last_active, _) in self._sessions.items() if last_active < cutoff]
+            for user_id in expired:
+                del self._sessions[user_id]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Keeps sessions in an SQLite database that worker processes can share
+
+    The database runs in WAL mode, so readers in other processes aren't blocked by a
+    write, and each save_many is a single transaction.
+    """
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        """
+        Args:
+            path: Database file, created if it doesn't exist
+            timeout: Seconds to wait for another process's write lock
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints rather than on every commit, which is enough for session state
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id TEXT PRIMARY KEY, last_active REAL NOT NULL, data BLOB NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions (last_active)")
+
+    def load(self, user_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection.execute("SELECT data FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def save_many(self, items: Iterable[Tuple[str, float, bytes]]) -> None:
+        rows = [(user_id, last_active, sqlite3.Binary(data)) for user_id, last_active, data in items]
+        if not rows:
+            return
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO sessions (user_id, last_active, data) VALUES (?, ?, ?)", rows)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def delete_expired(self, cutoff: float) -> int:
+        with self._lock:
+            return self._connection.execute("DELETE FROM sessions WHERE last_active < ?", (cutoff,)).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class FileSessionStore(SessionStore):
+    """
+    Keeps each session in its own file of a directory
+
+    Files are replaced atomically, so processes sharing the directory never read a
+    partly written session. Point it at a tmpfs directory such as /dev/shm to share
+    sessions between the processes of one host through memory.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: Directory for the session files, created if it doesn't exist
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.directory, quote(user_id, safe="") + ".session")
+
+    def load(self, user_id: str) -> Optional[bytes]:
+        try:
+            with open(self._path(user_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def save_many(self, items: Iterable[Tuple[str, float, bytes]]) -> None:
+        for user_id, last_active, data in items:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                # The file's mtime records last activity, for delete_expired
+                os.utime(temp_path, (last_active, last_active))
+                os.replace(temp_path, self._path(user_id))
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+
+    def delete_expired(self, cutoff: float) -> int:
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".session") and entry.stat().st_mtime < cutoff:
+                    try:
+                        os.unlink(entry.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass  # Removed by another process
+        return removed
@@ -1,18 +1,320 @@
+import os
 import re
 import json
+import time
 import datetime
 import random
-from typing import Dict, List, Tuple, Any, Optional, Union
+import logging
+import itertools
+import threading
+from array import array
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+from typing import Dict, List, Tuple, Any, Optional, Union, NamedTuple, Pattern, FrozenSet, Set, Iterable, Iterator
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants  # Python 3.11+
+except ImportError:
+    import sre_parse
+    import sre_constants
 
 # Import our Knowledge Base
 from knowledge_base import KnowledgeBase
+from cache import LRUCache
+from session import Session, HistoryEntry, read_spilled_history
+from flows import FlowEngine
+from session_store import SessionStore, encode_session, decode_session
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledIntent(NamedTuple):
+    """Precompiled patterns for a single intent"""
+    name: str
+    priority: float
+    context_independent: bool
+    patterns: Tuple[Pattern, ...]
+    # Global ids of the patterns, used by the literal prefilter
+    pattern_ids: Tuple[int, ...]
+
+
+class CompiledPatterns(NamedTuple):
+    """Everything match_intent needs, built once from the intent definitions"""
+    intents: List[CompiledIntent]
+    # Finds the longest anchor literal starting at each position of the input, None without anchors
+    anchor_scanner: Optional[Pattern]
+    # Anchor literal -> ids of the patterns anchored on it or on any anchor that is a prefix of it
+    anchor_patterns: Dict[str, FrozenSet[int]]
+    # Patterns without a required literal, always tried
+    unanchored: FrozenSet[int]
+    # Pattern id -> index of the intent that owns it
+    pattern_owner: Tuple[int, ...]
+    # Intents that only match while they are the current context
+    context_intents: FrozenSet[str]
+
+
+class EntityMatch(NamedTuple):
+    """A single entity found in user input"""
+    entity_type: str
+    value: Any
+    start: int
+    end: int
+
+
+class CompiledExtractor(NamedTuple):
+    """Precompiled entity extractor"""
+    entity_type: str
+    pattern: Pattern
+    transform: Any
+
+
+class MatcherState(NamedTuple):
+    """
+    Everything PatternMatcher derives from its patterns and knowledge base
+
+    Replaced as a whole on reload, so a request that picked up one state never sees
+    parts of another.
+    """
+    patterns: Dict[str, Dict]
+    compiled: CompiledPatterns
+    kb: KnowledgeBase
+    kb_info: Dict[str, Dict]
+    intent_cache: LRUCache
+
+
+class IntentBatch(NamedTuple):
+    """Columnar result of PatternMatcher.match_intents_batch"""
+    # Intent id -> intent name, id 0 is always "unknown"
+    intent_names: List[str]
+    # One entry per message
+    intent_ids: array
+    confidences: array
+
+
+# Largest literal set we expand when deriving anchors from a pattern
+_MAX_LITERAL_ALTERNATIVES = 64
+# Shorter literals are too common to narrow anything down
+_MIN_ANCHOR_LENGTH = 3
+_REPEAT_OPS = tuple(
+    getattr(sre_constants, name)
+    for name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+    if hasattr(sre_constants, name)
+)
+
+
+def _analyze_sequence(items) -> Tuple[Optional[Set[str]], List[FrozenSet[str]]]:
+    """
+    Work out which literal strings a parsed regex sequence requires
+
+    Returns:
+        Tuple of (strings, clauses). strings is the full set of strings the sequence
+        can match if that set is small and finite, otherwise None. Each clause is a set
+        of strings of which at least one must appear in any text the sequence matches.
+    """
+    # Merge runs of single characters so "password" is one node, not eight
+    nodes = []
+    for op, av in items:
+        if op is sre_constants.LITERAL and nodes and nodes[-1][0] == "run":
+            nodes[-1] = ("run", nodes[-1][1] + chr(av).lower())
+        elif op is sre_constants.LITERAL:
+            nodes.append(("run", chr(av).lower()))
+        else:
+            nodes.append((op, av))
+
+    clauses = []
+    run = {""}
+    finite = True
+
+    for op, av in nodes:
+        if op == "run":
+            node_strings, node_clauses = {av}, []
+        else:
+            node_strings, node_clauses = _analyze_node(op, av)
+
+        # Every part of a sequence is required on its own as well
+        clauses.extend(node_clauses)
+        if node_strings is not None:
+            clauses.append(frozenset(node_strings))
+
+        if node_strings is not None and len(run) * len(node_strings) <= _MAX_LITERAL_ALTERNATIVES:
+            run = {left + right for left in run for right in node_strings}
+            continue
+
+        finite = False
+        if run != {""}:
+            clauses.append(frozenset(run))
+        run = set(node_strings) if node_strings is not None else {""}
+
+    if run != {""}:
+        clauses.append(frozenset(run))
+    return (run if finite else None), clauses
+
+
+def _analyze_node(op, av) -> Tuple[Optional[Set[str]], List[FrozenSet[str]]]:
+    """Same as _analyze_sequence, for a single parsed regex node"""
+    if op is sre_constants.LITERAL:
+        return {chr(av).lower()}, []
+
+    if op is sre_constants.AT:
+        # Anchors are zero-width, they don't add or remove required text
+        return {""}, []
+
+    if op is sre_constants.IN:
+        if all(item_op is sre_constants.LITERAL for item_op, _ in av):
+            return {chr(item_av).lower() for _, item_av in av}, []
+        return None, []
+
+    if op is sre_constants.SUBPATTERN:
+        return _analyze_sequence(av[-1])
+
+    if op is sre_constants.BRANCH:
+        strings = set()
+        alternatives = set()
+        for branch in av[1]:
+            branch_strings, branch_clauses = _analyze_sequence(branch)
+            if strings is not None and branch_strings is not None:
+                strings |= branch_strings
+            else:
+                strings = None
+            # Each branch contributes its strongest clause, the union is required overall
+            best = _best_clause(branch_clauses)
+            if alternatives is not None and best is not None:
+                alternatives |= best
+            else:
+                alternatives = None
+        if strings is not None and len(strings) > _MAX_LITERAL_ALTERNATIVES:
+            strings = None
+        return strings, ([frozenset(alternatives)] if alternatives else [])
+
+    if op in _REPEAT_OPS:
+        low, high, item = av
+        item_strings, item_clauses = _analyze_sequence(item)
+        if item_strings is not None and low == high and len(item_strings) ** low <= _MAX_LITERAL_ALTERNATIVES:
+            strings = {""}
+            for _ in range(low):
+                strings = {left + right for left in strings for right in item_strings}
+            return strings, []
+        if item_strings is not None and low == 0 and high == 1:
+            return item_strings | {""}, []
+        if low >= 1:
+            if item_strings is not None:
+                item_clauses = item_clauses + [frozenset(item_strings)]
+            return None, item_clauses
+        return None, []
+
+    if op is getattr(sre_constants, "ATOMIC_GROUP", None):
+        return _analyze_sequence(av)
+
+    return None, []
+
+
+def _best_clause(clauses: List[FrozenSet[str]]) -> Optional[FrozenSet[str]]:
+    """
+    Pick the cheapest selective clause: fewest strings, then longest shortest-string
+
+    Surrounding whitespace is dropped, since any substring of a required string is
+    required too and bare words are shared between many patterns. Only ASCII clauses
+    are usable, non-ASCII literals can match ASCII text case-insensitively.
+    """
+    usable = []
+    for clause in clauses:
+        stripped = frozenset(string.strip() for string in clause)
+        if not stripped or not all(string.isascii() for string in stripped):
+            continue
+        if min(map(len, stripped)) >= _MIN_ANCHOR_LENGTH:
+            usable.append(stripped)
+    if not usable:
+        return None
+    return min(usable, key=lambda clause: (len(clause), -min(map(len, clause))))
+
+
+def required_literals(pattern: str) -> Optional[FrozenSet[str]]:
+    """
+    Find literal strings, one of which must appear in any text the pattern matches
+
+    Args:
+        pattern: A regular expression, interpreted case-insensitively
+
+    Returns:
+        Set of lowercase literals, or None if the pattern has no usable literal anchor
+    """
+    strings, clauses = _analyze_sequence(sre_parse.parse(pattern, re.IGNORECASE))
+    if strings is not None:
+        clauses.append(frozenset(strings))
+    return _best_clause(clauses)
+
+
+def _compile_anchor_scanner(literals: Iterable[str]) -> Optional[Pattern]:
+    """
+    Compile a regex finding the longest of the literals that starts at each position of a text
+
+    The literals are merged into a trie, e.g. "fee", "fees" and "feature" become
+    fe(?:e(?:s)?|ature), so the scan does the same work per character however many
+    literals there are. It is wrapped in a lookahead to report overlapping occurrences.
+    """
+    trie: Dict[str, dict] = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[""] = {}  # A literal ends here
+    if not trie:
+        return None
+    return re.compile(f"(?=({_trie_regex(trie)}))")
+
+
+def _trie_regex(node: Dict[str, dict]) -> str:
+    alternatives = [re.escape(char) + _trie_regex(child) for char, child in sorted(node.items()) if char]
+    if not alternatives:
+        return ""
+    regex = alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+    # Greedy, so the longest literal on the path wins
+    return f"(?:{regex})?" if "" in node else regex
+
+
+class _SessionShard:
+    """One slice of StateManager's sessions, with its own lock"""
+
+    __slots__ = ("sessions", "dirty", "lock")
 
-class StateManager:
-    """Manages conversation context and user session state"""
-    
     def __init__(self):
-        self.sessions = {}  # Dictionary to store session data for multiple users
-    
+        # Sessions by user id, least recently active first
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.dirty: Set[str] = set()  # Users whose session changed since the last flush
+        self.lock = threading.Lock()
+
+
+class StateManager:
+    """
+    Manages conversation context and user session state
+
+    Sessions are split over shards by user id, each with its own lock, so threads
+    serving different users rarely wait for each other. A session itself isn't locked:
+    messages of one user should be handled one at a time.
+    """
+
+    def __init__(self, history_size: int = 20, history_dir: str = None, store: SessionStore = None,
+                 num_shards: int = 16):
+        """
+        Args:
+            history_size: Number of message exchanges kept in memory per session
+            history_dir: Directory older exchanges are written to, one JSON-lines file
+                per user. Without it they are dropped.
+            store: Backend sessions are loaded from and written back to. Sessions in use
+                are served from memory and changes reach the store on flush(), so
+                requests of a user should keep going to the same process.
+            num_shards: Number of independently locked parts the sessions are split into
+        """
+        self._shards = tuple(_SessionShard() for _ in range(num_shards))
+        self.history_size = history_size
+        self.history_dir = history_dir
+        if history_dir:
+            os.makedirs(history_dir, exist_ok=True)
+        self.store = store
+        self._sweeper = None
+        self._stop_sweeper = threading.Event()
+
     def create_session(self, user_id: str) -> None:
         """
         Initialize a new user session.
@@ -20,166 +322,365 @@ class StateManager:
         Args:
             user_id (str): The unique identifier for the user whose session is being created.
         """
-        self.sessions[user_id] = {
-            "created_at": datetime.datetime.now(),
-            "last_active": datetime.datetime.now(),
-            "conversation_history": [],
-            "current_context": None,
-            "entity_memory": {},
-            "preferences": {},
-            "verification_level": "unknown",
-            "last_intent": None,
-            "flags": {
-                "needs_human": False,
-                "has_pending_query": False,
-                "is_new_user": True
-            },
-            "active_flows": [],  # For multi-step processes like registration, verification, etc.
-            "flow_states": {}    # State data for active flows
-        }
-    
-    def get_session(self, user_id: str) -> Dict:
+        shard = self._shard(user_id)
+        with shard.lock:
+            shard.sessions[user_id] = Session()
+            shard.sessions.move_to_end(user_id)
+            if self.store is not None:
+                shard.dirty.add(user_id)
+
+    def _shard(self, user_id: str) -> _SessionShard:
+        # Python's string hash differs between processes, so the shards stay balanced even
+        # when users are already routed to processes by a hash of their id
+        return self._shards[hash(user_id) % len(self._shards)]
+
+    @property
+    def sessions(self) -> Dict[str, Session]:
+        """Snapshot of all sessions in memory, by user id"""
+        sessions = {}
+        for shard in self._shards:
+            with shard.lock:
+                sessions.update(shard.sessions)
+        return sessions
+
+    def session_count(self) -> int:
+        """Number of sessions in memory"""
+        return sum(len(shard.sessions) for shard in self._shards)
+
+    def get_session(self, user_id: str) -> Session:
         """Get a user's session data, creating it if it doesn't exist"""
-        if user_id not in self.sessions:
-            self.create_session(user_id)
-        
-        # Update last active timestamp
-        self.sessions[user_id]["last_active"] = datetime.datetime.now()
-        return self.sessions[user_id]
-    
+        shard = self._shard(user_id)
+        with shard.lock:
+            session = shard.sessions.get(user_id)
+            if session is not None:
+                # Update last active timestamp, keeping sessions ordered by it
+                session.last_active = time.time()
+                shard.sessions.move_to_end(user_id)
+            elif self.store is None:
+                session = shard.sessions[user_id] = Session()
+            if self.store is not None:
+                # Callers may change the session, it is written back on the next flush
+                shard.dirty.add(user_id)
+        if session is None:
+            session = self._load_session(user_id, shard)
+        return session
+
+    def _load_session(self, user_id: str, shard: _SessionShard) -> Session:
+        """Get a session that isn't in memory from the store, or create it"""
+        data = self.store.load(user_id)
+        loaded = decode_session(data, self.history_size, self.history_path(user_id)) if data else Session()
+        loaded.last_active = time.time()
+
+        with shard.lock:
+            # Another thread may have loaded it while the store was being read
+            session = shard.sessions.setdefault(user_id, loaded)
+            session.last_active = loaded.last_active
+            shard.sessions.move_to_end(user_id)
+            shard.dirty.add(user_id)
+        return session
+
+    def flush(self) -> int:
+        """
+        Write sessions changed since the last flush to the store
+
+        Returns:
+            Number of sessions written
+        """
+        if self.store is None:
+            return 0
+
+        items = []
+        taken = []  # (shard, user ids) taken out of the shards' dirty sets
+        for shard in self._shards:
+            with shard.lock:
+                dirty, shard.dirty = shard.dirty, set()
+                sessions = [(user_id, shard.sessions.get(user_id)) for user_id in dirty]
+            taken.append((shard, dirty))
+
+            for user_id, session in sessions:
+                if session is None:
+                    continue
+                try:
+                    items.append((user_id, session.last_active, encode_session(session)))
+                except RuntimeError:
+                    # Changed by its request while being encoded, written on the next flush
+                    with shard.lock:
+                        shard.dirty.add(user_id)
+
+        try:
+            self.store.save_many(items)
+        except BaseException:
+            # Nothing was written, so the changes are still pending for the next flush
+            for shard, dirty in taken:
+                with shard.lock:
+                    shard.dirty |= dirty
+            raise
+        return len(items)
+
+    def close(self) -> None:
+        """Stop the sweeper, write back all changes and close the store"""
+        self.stop_sweeper()
+        if self.store is not None:
+            self.flush()
+            self.store.close()
+
+    def turn(self, user_id: str) -> Session:
+        """
+        Handle one message of a user with a single session lookup
+
+        Each get_*/set_* accessor looks the session up and touches last_active again.
+        A turn does that once and hands out the session, so everything the turn reads
+        and writes goes straight to it:
+
+            with state_manager.turn(user_id) as session:
+                session.set_last_intent(intent)
+                session.set_entity("cryptocurrency", "btc")
+                session.add_history(message, response, state_manager.history_size,
+                                    state_manager.history_path(user_id))
+
+        Args:
+            user_id: The user the message is from
+
+        Returns:
+            The user's session, created if it doesn't exist
+        """
+        return self.get_session(user_id)
+
+    def history_path(self, user_id: str) -> Optional[str]:
+        """Get the file a user's older messages are spilled to, None if spilling is off"""
+        if not self.history_dir:
+            return None
+        return os.path.join(self.history_dir, quote(user_id, safe="") + ".jsonl")
+
     def update_conversation_history(self, user_id: str, user_message: str, bot_response: str) -> None:
         """Add a message exchange to the conversation history"""
+        self.get_session(user_id).add_history(user_message, bot_response, self.history_size,
+                                              self.history_path(user_id))
+
+    def get_conversation_history(self, user_id: str, full: bool = False) -> List[HistoryEntry]:
+        """
+        Get a user's message exchanges, oldest first
+
+        Args:
+            user_id: The user whose history to get
+            full: Include the exchanges spilled to disk, if history_dir is set
+        """
         session = self.get_session(user_id)
-        session["conversation_history"].append({
-            "timestamp": datetime.datetime.now(),
-            "user_message": user_message,
-            "bot_response": bot_response
-        })
-        
-        # Limit history size to prevent memory issues
-        if len(session["conversation_history"]) > 20:
-            session["conversation_history"] = session["conversation_history"][-20:]
-    
+        history = list(session.conversation_history or ())
+        if full and self.history_dir:
+            history = read_spilled_history(self.history_path(user_id)) + history
+        return history
+
     def set_context(self, user_id: str, context: str, data: Dict = None) -> None:
         """Set the current conversation context"""
-        session = self.get_session(user_id)
-        session["current_context"] = context
-        
-        # Store any context-specific data
-        if data:
-            if "context_data" not in session:
-                session["context_data"] = {}
-            session["context_data"][context] = data
-    
+        self.get_session(user_id).set_context(context, data)
+
     def get_context(self, user_id: str) -> str:
         """Get the current conversation context"""
-        return self.get_session(user_id).get("current_context")
-    
+        return self.get_session(user_id).current_context
+
     def set_entity(self, user_id: str, entity_type: str, entity_value: Any) -> None:
         """Remember an entity mentioned by the user"""
-        session = self.get_session(user_id)
-        session["entity_memory"][entity_type] = entity_value
-    
+        self.get_session(user_id).set_entity(entity_type, entity_value)
+
     def get_entity(self, user_id: str, entity_type: str) -> Any:
         """Retrieve a remembered entity"""
-        return self.get_session(user_id).get("entity_memory", {}).get(entity_type)
-    
+        return self.get_session(user_id).get_entity(entity_type)
+
     def set_flag(self, user_id: str, flag_name: str, value: bool) -> None:
         """Set a state flag"""
-        session = self.get_session(user_id)
-        session["flags"][flag_name] = value
-    
+        self.get_session(user_id).set_flag(flag_name, value)
+
     def get_flag(self, user_id: str, flag_name: str) -> bool:
         """Get a state flag value"""
-        return self.get_session(user_id).get("flags", {}).get(flag_name, False)
-    
+        return self.get_session(user_id).get_flag(flag_name)
+
     def set_preference(self, user_id: str, preference: str, value: Any) -> None:
         """Set a user preference"""
-        session = self.get_session(user_id)
-        session["preferences"][preference] = value
-    
+        self.get_session(user_id).set_preference(preference, value)
+
     def get_preference(self, user_id: str, preference: str, default: Any = None) -> Any:
         """Get a user preference"""
-        return self.get_session(user_id).get("preferences", {}).get(preference, default)
-    
+        return self.get_session(user_id).get_preference(preference, default)
+
     def start_flow(self, user_id: str, flow_name: str, initial_state: Dict = None) -> None:
         """Start a multi-step conversation flow"""
-        session = self.get_session(user_id)
-        if flow_name not in session["active_flows"]:
-            session["active_flows"].append(flow_name)
-        
-        session["flow_states"][flow_name] = initial_state or {"step": 0}
-        
-        # Set current context to this flow
-        self.set_context(user_id, flow_name)
-    
+        self.get_session(user_id).start_flow(flow_name, initial_state)
+
     def update_flow_state(self, user_id: str, flow_name: str, state_updates: Dict) -> None:
         """Update the state of an active flow"""
-        session = self.get_session(user_id)
-        if flow_name in session["flow_states"]:
-            session["flow_states"][flow_name].update(state_updates)
-    
+        self.get_session(user_id).update_flow_state(flow_name, state_updates)
+
     def get_flow_state(self, user_id: str, flow_name: str) -> Dict:
         """Get the current state of an active flow"""
-        return self.get_session(user_id).get("flow_states", {}).get(flow_name, {})
-    
+        return self.get_session(user_id).get_flow_state(flow_name)
+
     def end_flow(self, user_id: str, flow_name: str) -> None:
         """End a multi-step conversation flow"""
-        session = self.get_session(user_id)
-        if flow_name in session["active_flows"]:
-            session["active_flows"].remove(flow_name)
-        
-        if flow_name in session.get("flow_states", {}):
-            del session["flow_states"][flow_name]
-        
-        # If this was the current context, reset it
-        if self.get_context(user_id) == flow_name:
-            self.set_context(user_id, None)
-    
+        self.get_session(user_id).end_flow(flow_name)
+
     def set_last_intent(self, user_id: str, intent: str) -> None:
         """Set the last detected user intent"""
-        session = self.get_session(user_id)
-        session["last_intent"] = intent
-    
+        self.get_session(user_id).set_last_intent(intent)
+
     def get_last_intent(self, user_id: str) -> str:
         """Get the last detected user intent"""
-        return self.get_session(user_id).get("last_intent")
-    
+        return self.get_session(user_id).last_intent
+
     def get_session_age(self, user_id: str) -> datetime.timedelta:
         """Get the age of the current session"""
         session = self.get_session(user_id)
-        return datetime.datetime.now() - session["created_at"]
-    
+        return datetime.timedelta(seconds=time.time() - session.created_at)
+
     def get_inactive_time(self, user_id: str) -> datetime.timedelta:
         """Get the time since the user was last active"""
-        session = self.get_session(user_id)
-        return datetime.datetime.now() - session["last_active"]
-    
+        # Measured before get_session touches the timestamp
+        session = self._shard(user_id).sessions.get(user_id)
+        inactive = time.time() - session.last_active if session is not None else 0.0
+        self.get_session(user_id)
+        return datetime.timedelta(seconds=max(inactive, 0.0))
+
     def cleanup_old_sessions(self, max_age_hours: int = 24) -> int:
-        """Remove sessions older than the specified age"""
-        current_time = datetime.datetime.now()
-        old_sessions = []
-        
-        for user_id, session in self.sessions.items():
-            if current_time - session["last_active"] > datetime.timedelta(hours=max_age_hours):
-                old_sessions.append(user_id)
-        
-        for user_id in old_sessions:
-            del self.sessions[user_id]
-        
-        return len(old_sessions)
+        """
+        Remove sessions that have been inactive longer than the specified age
+
+        Each shard keeps its sessions ordered by last activity, so only the expired ones
+        at the front are looked at and a sweep that finds nothing to remove is
+        O(shards). Shards are locked one at a time, the others keep serving requests.
+        """
+        cutoff = time.time() - max_age_hours * 3600
+        expired = []
+
+        for shard in self._shards:
+            with shard.lock:
+                sessions = shard.sessions
+                while sessions:
+                    user_id, session = next(iter(sessions.items()))
+                    if session.last_active >= cutoff:
+                        break
+                    del sessions[user_id]
+                    expired.append(session)
+                    shard.dirty.discard(user_id)
+
+        # Keep complete transcripts of expired sessions, outside the lock
+        for session in expired:
+            if session.conversation_history is not None:
+                session.conversation_history.spill()
+        if self.store is not None:
+            # Sessions other processes kept using have a newer last_active there and stay
+            self.store.delete_expired(cutoff)
+
+        return len(expired)
+
+    def start_sweeper(self, interval: float = 60.0, max_age_hours: float = 24) -> None:
+        """
+        Remove expired sessions and write back changed ones every interval seconds on
+        a background thread
+
+        Args:
+            interval: Seconds between sweeps
+            max_age_hours: Inactivity after which a session is removed
+        """
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+
+        def sweep():
+            while not self._stop_sweeper.wait(interval):
+                try:
+                    self.cleanup_old_sessions(max_age_hours)
+                    self.flush()
+                except Exception:
+                    # Keep sweeping, a store that failed (locked, disk full) gets another try
+                    logger.exception("Session sweep failed")
+
+        self._stop_sweeper.clear()
+        self._sweeper = threading.Thread(target=sweep, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        """Stop the background sweeper and wait for it to finish"""
+        self._stop_sweeper.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
 
 
 class PatternMatcher:
     """Identifies patterns in user input to determine intent and extract entities"""
     
-    def __init__(self, knowledge_base: KnowledgeBase):
-        self.kb = knowledge_base
-        self.patterns = self._load_patterns()
+    def __init__(self, knowledge_base: KnowledgeBase, cache_size: int = 1024, cache_ttl: Optional[float] = None,
+                 patterns_path: str = None):
+        """
+        Args:
+            knowledge_base: The knowledge base intents are answered from
+            cache_size: Number of normalized messages to remember results for, 0 to disable
+            cache_ttl: Seconds a cached result stays valid, None for no expiry
+            patterns_path: JSON file with intent definitions, the built-in patterns are used if omitted
+        """
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.patterns_path = patterns_path
         self.entity_extractors = self._load_entity_extractors()
-    
+        self._entity_scanner, self._extractors = self._compile_entity_extractors(self.entity_extractors)
+        self._entity_cache = LRUCache(cache_size, cache_ttl)
+        self._state = self._build_state(self._load_patterns(), knowledge_base)
+
+    @property
+    def patterns(self) -> Dict[str, Dict]:
+        return self._state.patterns
+
+    @property
+    def kb(self) -> KnowledgeBase:
+        return self._state.kb
+
+    def _build_state(self, patterns: Dict[str, Dict], knowledge_base: KnowledgeBase) -> MatcherState:
+        """Compile patterns and resolve KB slices into a new, self-contained state"""
+        return MatcherState(
+            patterns=patterns,
+            compiled=self._compile_patterns(patterns),
+            kb=knowledge_base,
+            kb_info=self._resolve_knowledge_base_info(patterns, knowledge_base),
+            # A fresh cache, so results computed against an old state can't leak in
+            intent_cache=LRUCache(self.cache_size, self.cache_ttl)
+        )
+
+    def reload(self, patterns: Dict[str, Dict] = None, knowledge_base: KnowledgeBase = None) -> None:
+        """
+        Rebuild patterns, KB slices and the intent cache, then swap them in atomically
+
+        Everything is built before the swap, so requests running in other threads keep
+        using the complete old state until they pick up the complete new one.
+
+        Args:
+            patterns: New intent definitions, reloaded from _load_patterns if omitted
+            knowledge_base: New knowledge base, the current one is kept if omitted
+        """
+        patterns = patterns if patterns is not None else self._load_patterns()
+        knowledge_base = knowledge_base if knowledge_base is not None else self._state.kb
+        self._state = self._build_state(patterns, knowledge_base)
+
+    def reload_patterns(self, patterns: Dict[str, Dict] = None) -> None:
+        """
+        Replace the intent patterns and drop cached intent results
+
+        Args:
+            patterns: New intent definitions, reloaded from _load_patterns if omitted
+        """
+        self.reload(patterns=patterns)
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Get hit/miss/eviction counters of the intent and entity caches"""
+        return {
+            "intent": self._state.intent_cache.stats(),
+            "entities": self._entity_cache.stats()
+        }
+
     def _load_patterns(self) -> Dict[str, Dict]:
-        """Load intent patterns - in real implementation, this could come from a file or database"""
+        """Load intent patterns from patterns_path if set, otherwise use the built-in ones"""
+        if self.patterns_path:
+            with open(self.patterns_path, encoding="utf-8") as f:
+                return json.load(f)
+
         return {
             # General patterns
             "greeting": {
@@ -419,7 +920,7 @@ class PatternMatcher:
                 "transform": lambda match: f"tier{match.group(2)}"
             },
             "amount": {
-                "pattern":                 git remote add origin <your-repository-url>
+                "pattern": r"(\d+(?:\.\d+)?)\s*(btc|eth|xrp|ltc|sol|ada|dot|avax|usdt|usdc|dai|busd|usd|eur|gbp)",
                 "transform": lambda match: {
                     "value": float(match.group(1)),
                     "currency": match.group(2).lower()
@@ -437,7 +938,86 @@ class PatternMatcher:
                 "transform": lambda match: match.group(1).lower()
             }
         }
-    
+
+    def _compile_patterns(self, patterns: Dict[str, Dict]) -> CompiledPatterns:
+        """
+        Compile intent patterns and build the literal prefilter index
+
+        Every pattern is compiled once. For each pattern we also derive a set of literal
+        anchors (e.g. "password", "fees") that any matching text must contain, and index
+        pattern ids by those literals. Patterns without an anchor are always tried.
+
+        Args:
+            patterns: Intent definitions as returned by _load_patterns
+
+        Returns:
+            CompiledPatterns bundle used by match_intent
+        """
+        intents = []
+        pattern_owner = []
+        literal_patterns = {}  # literal -> ids of patterns anchored on it
+        unanchored = set()
+
+        for intent_index, (intent_name, intent_data) in enumerate(patterns.items()):
+            pattern_ids = []
+            for pattern in intent_data["patterns"]:
+                pattern_id = len(pattern_owner)
+                pattern_owner.append(intent_index)
+                pattern_ids.append(pattern_id)
+
+                literals = required_literals(pattern)
+                if literals is None:
+                    unanchored.add(pattern_id)
+                    continue
+                for literal in literals:
+                    literal_patterns.setdefault(literal, set()).add(pattern_id)
+
+            intents.append(CompiledIntent(
+                name=intent_name,
+                priority=intent_data.get("priority", 1),
+                context_independent=intent_data.get("context_independent", False),
+                patterns=tuple(re.compile(pattern, re.IGNORECASE) for pattern in intent_data["patterns"]),
+                pattern_ids=tuple(pattern_ids)
+            ))
+
+        # The scanner reports only the longest anchor at each position, so an anchor also
+        # stands for the anchors that are prefixes of it ("fees" for "fee")
+        anchor_patterns = {}
+        for literal in literal_patterns:
+            pattern_ids = set()
+            for length in range(1, len(literal) + 1):
+                pattern_ids |= literal_patterns.get(literal[:length], set())
+            anchor_patterns[literal] = frozenset(pattern_ids)
+
+        return CompiledPatterns(
+            intents=intents,
+            anchor_scanner=_compile_anchor_scanner(literal_patterns),
+            anchor_patterns=anchor_patterns,
+            unanchored=frozenset(unanchored),
+            pattern_owner=tuple(pattern_owner),
+            context_intents=frozenset(intent.name for intent in intents if not intent.context_independent)
+        )
+
+    def _candidate_patterns(self, user_input: str, compiled: CompiledPatterns) -> Optional[Set[int]]:
+        """
+        Find the ids of patterns that can possibly match the (lowercased) input
+
+        Returns:
+            Set of pattern ids, or None when every pattern has to be tried
+        """
+        # Case-insensitive matching folds a few non-ASCII characters onto ASCII
+        # letters (e.g. the long s), which a plain substring test would miss
+        if not user_input.isascii():
+            return None
+
+        candidates = set(compiled.unanchored)
+        if compiled.anchor_scanner is not None:
+            # One pass over the input finds every anchor it contains, however many there are
+            anchor_patterns = compiled.anchor_patterns
+            for literal in set(compiled.anchor_scanner.findall(user_input)):
+                candidates |= anchor_patterns[literal]
+        return candidates
+
     def match_intent(self, user_input: str, current_context: str = None) -> Tuple[str, float]:
         """
         Match user input against patterns to determine intent
@@ -449,34 +1029,58 @@ class PatternMatcher:
         Returns:
             Tuple of (intent_name, confidence_score)
         """
+        state = self._state
         user_input = user_input.lower().strip()
-        matches = []
-        
-        # Check each intent pattern
-        for intent_name, intent_data in self.patterns.items():
+
+        # The context only changes the result when it names a context-dependent intent
+        context_key = current_context if current_context in state.compiled.context_intents else None
+        key = (user_input, context_key)
+
+        result = state.intent_cache.get(key)
+        if result is None:
+            result = self._match_normalized(user_input, current_context, state.compiled)
+            state.intent_cache.put(key, result)
+        return result
+
+    def _match_normalized(self, user_input: str, current_context: str,
+                          compiled: CompiledPatterns) -> Tuple[str, float]:
+        """match_intent for input that is already lowercased and stripped"""
+        best = None
+
+        candidates = self._candidate_patterns(user_input, compiled)
+        if candidates is None:
+            intents = compiled.intents
+        else:
+            # Only intents owning a candidate pattern, in definition order for tie-breaking
+            owners = sorted({compiled.pattern_owner[pattern_id] for pattern_id in candidates})
+            intents = [compiled.intents[intent_index] for intent_index in owners]
+
+        for intent in intents:
             # Skip context-dependent patterns if they don't match the current context
-            if not intent_data.get("context_independent", False) and current_context != intent_name:
+            if not intent.context_independent and current_context != intent.name:
                 continue
-                
-            # Try each pattern for this intent
-            for pattern in intent_data["patterns"]:
-                match = re.search(pattern, user_input, re.IGNORECASE)
+
+            # Try each pattern for this intent, the first one that matches wins
+            for pattern_id, pattern in zip(intent.pattern_ids, intent.patterns):
+                if candidates is not None and pattern_id not in candidates:
+                    continue
+                match = pattern.search(user_input)
                 if match:
                     # Calculate a confidence score based on how much of the input was matched
                     match_length = match.end() - match.start()
                     coverage = match_length / len(user_input)
                     # Adjust by pattern priority
-                    confidence = coverage * intent_data.get("priority", 1)
-                    
-                    matches.append((intent_name, confidence))
-                    break  # Found a match for this intent, move to next intent
-        
-        if not matches:
+                    confidence = coverage * intent.priority
+
+                    # Keep the first intent with the highest confidence, same as a stable sort
+                    if best is None or confidence > best[1]:
+                        best = (intent.name, confidence)
+                    break
+
+        if best is None:
             return ("unknown", 0.0)
-            
-        # Return the intent with highest confidence
-        matches.sort(key=lambda x: x[1], reverse=True)
-        return matches[0]
+
+        return best
     
     def extract_entities(self, user_input: str) -> Dict[str, Any]:
         """
@@ -488,51 +1092,286 @@ class PatternMatcher:
         Returns:
             Dictionary of entity_type -> entity_value
         """
+        cache = self._entity_cache
         user_input = user_input.lower()
+
+        entities = cache.get(user_input)
+        if entities is None:
+            entities = self._extract_normalized(user_input)
+            cache.put(user_input, entities)
+
+        # Callers may modify the result, so never hand out the cached objects
+        return _copy_entities(entities)
+
+    def _extract_normalized(self, user_input: str) -> Dict[str, Any]:
+        """extract_entities for input that is already lowercased"""
+        values = {}
+        for entity in self._scan_entities(user_input):
+            values.setdefault(entity.entity_type, []).append(entity.value)
+
+        # Same shape as before: one value as a scalar, several as a list, in extractor order
         entities = {}
-        
-        for entity_type, extractor in self.entity_extractors.items():
-            matches = re.finditer(extractor["pattern"], user_input, re.IGNORECASE)
-            
-            for match in matches:
-                # Transform the match using the entity-specific transform function
-                value = extractor["transform"](match)
-                
-                # If we already have this entity type, make it a list
-                if entity_type in entities:
-                    if not isinstance(entities[entity_type], list):
-                        entities[entity_type] = [entities[entity_type]]
-                    entities[entity_type].append(value)
-                else:
-                    entities[entity_type] = value
-        
+        for extractor in self._extractors:
+            found = values.get(extractor.entity_type)
+            if found:
+                entities[extractor.entity_type] = found[0] if len(found) == 1 else found
         return entities
-    
+
+    def extract_entity_matches(self, user_input: str) -> List[EntityMatch]:
+        """
+        Extract entities from user input as typed matches with their positions
+
+        Args:
+            user_input: The user's message
+
+        Returns:
+            List of EntityMatch, ordered by position in the input
+        """
+        return self._scan_entities(user_input.lower())
+
+    def _compile_entity_extractors(self, extractors: Dict[str, Dict]) -> Tuple[Pattern, Tuple[CompiledExtractor, ...]]:
+        """
+        Compile entity extractors and a combined scanner over all of them
+
+        Returns:
+            Tuple of (scanner, compiled_extractors). The scanner is one alternation of
+            every extractor pattern, used to jump straight to positions where some
+            entity starts.
+        """
+        compiled = tuple(
+            CompiledExtractor(entity_type, re.compile(extractor["pattern"], re.IGNORECASE), extractor["transform"])
+            for entity_type, extractor in extractors.items()
+        )
+        scanner = re.compile(
+            "|".join(f"(?:{extractor['pattern']})" for extractor in extractors.values()) or r"(?!)",
+            re.IGNORECASE
+        )
+        return scanner, compiled
+
+    def _scan_entities(self, user_input: str) -> List[EntityMatch]:
+        """
+        Find all entities in one left-to-right pass over the input
+
+        The combined scanner finds the next position where any entity type matches.
+        Every extractor is then tried at that position, which gives the same matches
+        as running re.finditer once per entity type: each type still skips positions
+        inside its own previous match, but different types may overlap
+        (e.g. "0.5 btc" is both an amount and a cryptocurrency).
+        """
+        scanner = self._entity_scanner
+        extractors = self._extractors
+        next_start = [0] * len(extractors)
+        found = []
+
+        position = 0
+        while True:
+            hit = scanner.search(user_input, position)
+            if hit is None:
+                break
+            start = hit.start()
+
+            for index, extractor in enumerate(extractors):
+                if start < next_start[index]:
+                    continue
+                match = extractor.pattern.match(user_input, start)
+                if match:
+                    # Transform the match using the entity-specific transform function
+                    found.append(EntityMatch(extractor.entity_type, extractor.transform(match),
+                                             match.start(), match.end()))
+                    next_start[index] = max(match.end(), start + 1)
+
+            position = start + 1
+
+        return found
+
+    def match_intents_batch(self, messages: Iterable[str], current_context: str = None,
+                            processes: int = 0, chunksize: int = 1000) -> IntentBatch:
+        """
+        Match many messages at once, e.g. when replaying chat transcripts offline
+
+        Each message is normalized once, and repeated messages within a batch are only
+        matched once. With processes > 1 the messages are split into chunks and matched
+        in a process pool, which only pays off for very large inputs.
+
+        Args:
+            messages: The user messages, any iterable (e.g. lines of a log file)
+            current_context: The conversation context applied to every message
+            processes: Number of worker processes, 0 or 1 to match in this process
+            chunksize: Number of messages sent to a worker at a time
+
+        Returns:
+            IntentBatch with one intent id and confidence per message
+        """
+        state = self._state
+        intent_names = ["unknown"] + list(state.patterns)
+        intent_ids = array("H")
+        confidences = array("d")
+
+        if processes and processes > 1:
+            for chunk_ids, chunk_confidences in self._map_chunks(
+                    _match_chunk, messages, processes, chunksize, state.patterns, current_context):
+                intent_ids.extend(chunk_ids)
+                confidences.extend(chunk_confidences)
+        else:
+            chunk_ids, chunk_confidences = self._match_chunk(messages, current_context, state)
+            intent_ids.extend(chunk_ids)
+            confidences.extend(chunk_confidences)
+
+        return IntentBatch(intent_names, intent_ids, confidences)
+
+    def extract_entities_batch(self, messages: Iterable[str], processes: int = 0,
+                               chunksize: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Extract entities from many messages at once
+
+        Args:
+            messages: The user messages, any iterable
+            processes: Number of worker processes, 0 or 1 to extract in this process
+            chunksize: Number of messages sent to a worker at a time
+
+        Returns:
+            List of entity dictionaries, one per message, same shape as extract_entities
+        """
+        if processes and processes > 1:
+            results = []
+            for chunk in self._map_chunks(_extract_chunk, messages, processes, chunksize, self.patterns):
+                results.extend(chunk)
+            return results
+
+        return [self._extract_normalized(message.lower()) for message in messages]
+
+    def _match_chunk(self, messages: Iterable[str], current_context: str = None,
+                     state: MatcherState = None) -> Tuple[array, array]:
+        """Match a chunk of messages, returning (intent ids, confidences) columns"""
+        state = state or self._state
+        intent_index = {name: index for index, name in enumerate(state.patterns, start=1)}
+        intent_index["unknown"] = 0
+        intent_ids = array("H")
+        confidences = array("d")
+        seen = {}
+
+        for message in messages:
+            normalized = message.lower().strip()
+            result = seen.get(normalized)
+            if result is None:
+                intent, confidence = self._match_normalized(normalized, current_context, state.compiled)
+                result = seen[normalized] = (intent_index[intent], confidence)
+            intent_ids.append(result[0])
+            confidences.append(result[1])
+
+        return intent_ids, confidences
+
+    def _map_chunks(self, function, messages: Iterable[str], processes: int, chunksize: int,
+                    patterns: Dict[str, Dict], *args) -> Iterator:
+        """
+        Run function over chunks of messages in a process pool, yielding results in order
+
+        Only a few chunks per worker are in flight at any time, so arbitrarily long
+        iterables (e.g. a log file) are streamed rather than loaded into memory.
+        """
+        messages = iter(messages)
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_batch_worker,
+                                 initargs=(type(self), patterns)) as executor:
+            pending = deque()
+            while True:
+                while len(pending) < processes * 2:
+                    chunk = list(itertools.islice(messages, chunksize))
+                    if not chunk:
+                        break
+                    pending.append(executor.submit(function, chunk, *args))
+                if not pending:
+                    break
+                yield pending.popleft().result()
+
     def get_knowledge_base_info(self, intent: str) -> Dict:
         """Get relevant knowledge base information for an intent"""
-        intent_data = self.patterns.get(intent, {})
-        
-        if "category" in intent_data:
-            category = intent_data["category"]
-            subcategory = intent_data.get("subcategory")
-            topic = intent_data.get("topic")
-            
-            return {
-                "category": category,
-                "subcategory": subcategory,
-                "topic": topic,
-                "kb_data": self.kb.get_info(category, subcategory, topic)
-            }
-        
-        return None
+        return self._state.kb_info.get(intent)
+
+    def _resolve_knowledge_base_info(self, patterns: Dict[str, Dict], knowledge_base: KnowledgeBase) -> Dict[str, Dict]:
+        """Look up the knowledge base slice of every intent once, instead of once per message"""
+        kb_info = {}
+        for intent, intent_data in patterns.items():
+            if "category" in intent_data:
+                category = intent_data["category"]
+                subcategory = intent_data.get("subcategory")
+                topic = intent_data.get("topic")
+
+                kb_info[intent] = {
+                    "category": category,
+                    "subcategory": subcategory,
+                    "topic": topic,
+                    "kb_data": knowledge_base.get_info(category, subcategory, topic)
+                }
+        return kb_info
+
+
+_MISSING = object()
+
+
+def _copy_entities(entities: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy an entity dict deep enough that changing it can't affect the original"""
+    copied = {}
+    for entity_type, value in entities.items():
+        if isinstance(value, list):
+            value = [dict(item) if isinstance(item, dict) else item for item in value]
+        elif isinstance(value, dict):
+            value = dict(value)
+        copied[entity_type] = value
+    return copied
+
+
+# Matcher used by batch worker processes, built once per worker
+_batch_matcher = None
+
+
+def _init_batch_worker(matcher_class: type, patterns: Dict[str, Dict]) -> None:
+    """Build the worker's matcher from the parent's intent definitions"""
+    global _batch_matcher
+    _batch_matcher = matcher_class(KnowledgeBase(), cache_size=0)
+    _batch_matcher.reload_patterns(patterns)
+
+
+def _match_chunk(messages: List[str], current_context: str = None) -> Tuple[array, array]:
+    return _batch_matcher._match_chunk(messages, current_context)
+
+
+def _extract_chunk(messages: List[str]) -> List[Dict[str, Any]]:
+    return [_batch_matcher._extract_normalized(message.lower()) for message in messages]
 
 
 class ResponseGenerator:
     """Generates appropriate responses based on intent, entities, and context"""
     
-    def __init__(self, knowledge_base: KnowledgeBase):
+    def __init__(self, knowledge_base: KnowledgeBase, response_cache_size: int = 1024):
+        """
+        Args:
+            knowledge_base: The knowledge base responses are built from
+            response_cache_size: Number of dynamic responses remembered per intent, 0 to disable
+        """
         self.kb = knowledge_base
+        self.response_cache_size = response_cache_size
         self.templates = self._load_templates()
+        self.flows = FlowEngine()
+        # Intents answered with a random one of their fixed templates
+        self._choices = {intent: tuple(templates) for intent, templates in self.templates.items()
+                         if isinstance(templates, list) and all(isinstance(t, str) for t in templates)}
+        # Intents with dynamic responses: (prepare, render, entity types). prepare precomputes
+        # what it can from the intent's KB data, render builds the response from that and the
+        # entities. Responses only depend on the listed entities, so they are cached by them.
+        self._renderers = {
+            "trading_hours": (self._prepare_trading_hours, self._render_trading_hours, ()),
+            "supported_crypto": (self._prepare_supported_crypto, self._render_supported_crypto,
+                                 ("cryptocurrency",)),
+            "fees": (self._prepare_fees, self._render_fees, ("fee_type", "cryptocurrency")),
+            "verification_info": (self._prepare_verification_info, self._render_verification_info,
+                                  ("verification_tier",)),
+        }
+        # intent -> (KB data, prepared fragments, cached responses by entity values)
+        self._fragments: Dict[str, Tuple[Any, Any, Dict[tuple, str]]] = {}
+
+    def reload(self, knowledge_base: KnowledgeBase) -> None:
+        """Answer from a new knowledge base"""
+        self.kb = knowledge_base
         
     def _load_templates(self) -> Dict:
         """Load response templates - in a real system, this could come from a file or database"""
@@ -581,107 +1420,150 @@ class ResponseGenerator:
         Returns:
             Generated response text
         """
-        # Check if we have a template for this intent
-        if intent in self.templates:
-            templates = self.templates[intent]
-            # For simple templates, just return a random one
-            if isinstance(templates, list) and all(isinstance(t, str) for t in templates):
-                return random.choice(templates)
-        
+        # For simple templates, just return a random one
+        choices = self._choices.get(intent)
+        if choices is not None:
+            return random.choice(choices)
+
         # Handle dynamic responses based on intent
-        if intent == "trading_hours":
-            trading_hours = kb_info["kb_data"]["trading"]
-            maintenance = kb_info["kb_data"]["maintenance"]
-            return f"CryptoLocal Exchange is open for trading {trading_hours}. Our scheduled maintenance window is {maintenance}."
-        
-        elif intent == "supported_crypto":
-            cryptos = kb_info["kb_data"]["major_cryptos"]
-            stablecoins = kb_info["kb_data"]["stablecoins"]
-            
-            # If a specific cryptocurrency was mentioned, check if we support it
-            if "cryptocurrency" in entities:
-                crypto = entities["cryptocurrency"]
-                if isinstance(crypto, list):
-                    crypto = crypto[0]  # Just take the first one if multiple were mentioned
-                
-                # Check if it's in our supported list
-                all_supported = cryptos + stablecoins
-                if crypto.lower() in [c.lower() for c in all_supported]:
-                    return f"Yes, we do support {crypto.upper()}! You can trade it on our exchange."
-                else:
-                    return f"I'm sorry, we don't currently support {crypto.upper()} on our exchange. We regularly add new cryptocurrencies, so please check back for updates."
-            
-            # Otherwise, give general information
-            return f"CryptoLocal Exchange supports major cryptocurrencies including {', '.join(cryptos[:3])} and more. We also support stablecoins such as {', '.join(stablecoins[:2])}. Would you like to see the full list of supported cryptocurrencies?"
-        
-        elif intent == "fees":
-            trading_fees = kb_info["kb_data"]["trading"]
-            withdrawal = kb_info["kb_data"]["withdrawal"]
-            
-            # If the user asked about a specific fee type
-            if "fee_type" in entities:
-                fee_type = entities["fee_type"]
-                if fee_type == "trading":
-                    return f"Our trading fees are {trading_fees['maker']*100}% for maker orders and {trading_fees['taker']*100}% for taker orders. Volume discounts are available for high-volume traders."
-                elif fee_type == "withdrawal":
-                    # If they asked about a specific cryptocurrency's withdrawal fee
-                    if "cryptocurrency" in entities:
-                        crypto = entities["cryptocurrency"]
-                        if isinstance(crypto, list):
-                            crypto = crypto[0]
-                        
-                        if crypto.upper() in withdrawal:
-                            fee = withdrawal[crypto.upper()]
-                            return f"The withdrawal fee for {crypto.upper()} is {fee} {crypto.upper()}."
-                        else:
-                            return f"I don't have the specific withdrawal fee for {crypto.upper()}. Please check our fee schedule on the website or contact support."
-                    else:
-                        return "Our withdrawal fees vary by cryptocurrency. For example, BTC withdrawal fee is 0.0005 BTC. Would you like to know about a specific cryptocurrency's withdrawal fee?"
-            
-            # General fee information
-            return "CryptoLocal Exchange offers competitive fees. Trading fees start at 0.1% maker / 0.15% taker with volume discounts available. Withdrawal fees vary by cryptocurrency. Would you like more specific information about a particular fee type?"
-        
-        elif intent == "verification_info":
-            tiers = kb_info["kb_data"]
-            
-            # If they asked about a specific tier
-            if "verification_tier" in entities:
-                tier = entities["verification_tier"]
-                if tier in tiers:
-                    tier_info = tiers[tier]
-                    requirements = ", ".join(tier_info["requirements"])
-                    limits = tier_info["limits"]
-                    return f"{tier.capitalize()} verification requires: {requirements}. With this level, your daily trading limit is ${limits['daily_trading']} and daily withdrawal limit is ${limits['daily_withdrawal']}."
-                else:
-                    return f"I don't have information about {tier}. Our verification levels include Tier 1 (Basic), Tier 2 (Verified), and Tier 3 (Enhanced)."
-            
-            # General verification information
-            return "CryptoLocal Exchange has 3 verification tiers. Tier 1 (Basic) requires email and phone verification with a $2,000 daily limit. Tier 2 requires ID and proof of address with a $10,000 daily limit. Tier 3 adds a verification call with a $50,000 daily limit. Would you like more details about a specific tier?"
-        
-        # Handle other intents similarly...
-        
+        renderer = self._renderers.get(intent)
+        if renderer is not None:
+            prepare, render, entity_types = renderer
+            _, fragments, responses = self._prepared(intent, prepare, kb_info["kb_data"])
+
+            key = tuple([entities.get(entity_type, _MISSING) for entity_type in entity_types])
+            try:
+                response = responses.get(key)
+            except TypeError:
+                # Several values for an entity, not worth caching
+                return render(entities, fragments)
+            if response is None:
+                response = render(entities, fragments)
+                if len(responses) < self.response_cache_size:
+                    responses[key] = response
+            return response
+
         # For intents without specific handling or templates, use KB data directly with a generic template
         if kb_info and "kb_data" in kb_info:
-            # Create a response based on KB data - this is simplified and would be more sophisticated in a real system
-            if isinstance(kb_info["kb_data"], dict):
-                keys = list(kb_info["kb_data"].keys())[:3]  # Just use first few keys to avoid overwhelming
-                return f"Here's what I know about {intent.replace('_', ' ')}: " + ", ".join([f"{key}: {str(kb_info['kb_data'][key])[:50]}..." for key in keys])
-            elif isinstance(kb_info["kb_data"], list):
-                items = kb_info["kb_data"][:3]  # Just use first few items to avoid overwhelming
-                return f"Here's what I know about {intent.replace('_', ' ')}: " + ", ".join([str(item) for item in items])
-            else:
-                return f"About {intent.replace('_', ' ')}: {str(kb_info['kb_data'])}"
-        
+            return self._prepared(intent, self._prepare_generic, kb_info["kb_data"])[1]
+
         # Fallback response if no specific handling is available
         return "I understand you're asking about " + intent.replace("_", " ") + ". Let me look into that for you."
+
+    def _prepared(self, intent: str, prepare, kb_data: Any) -> Any:
+        """
+        Get the fragments prepare() precomputes from an intent's KB data
+
+        They are built the first time the data is seen and kept until the intent is
+        answered from a different object, e.g. after the knowledge base was reloaded.
+        The responses cached for the intent are dropped along with them.
+
+        Returns:
+            (KB data, fragments, cached responses)
+        """
+        entry = self._fragments.get(intent)
+        if entry is None or entry[0] is not kb_data:
+            entry = self._fragments[intent] = (kb_data, prepare(intent, kb_data), {})
+        return entry
+
+    @staticmethod
+    def _first_entity(entities: Dict, entity_type: str) -> Any:
+        value = entities[entity_type]
+        if isinstance(value, list):
+            value = value[0]  # Just take the first one if multiple were mentioned
+        return value
+
+    def _prepare_trading_hours(self, intent: str, kb_data: Dict) -> str:
+        return f"CryptoLocal Exchange is open for trading {kb_data['trading']}. Our scheduled maintenance window is {kb_data['maintenance']}."
+
+    def _render_trading_hours(self, entities: Dict, response: str) -> str:
+        return response
+
+    def _prepare_supported_crypto(self, intent: str, kb_data: Dict) -> Tuple[FrozenSet[str], str]:
+        cryptos = kb_data["major_cryptos"]
+        stablecoins = kb_data["stablecoins"]
+        supported = frozenset(c.lower() for c in cryptos + stablecoins)
+        overview = f"CryptoLocal Exchange supports major cryptocurrencies including {', '.join(cryptos[:3])} and more. We also support stablecoins such as {', '.join(stablecoins[:2])}. Would you like to see the full list of supported cryptocurrencies?"
+        return supported, overview
+
+    def _render_supported_crypto(self, entities: Dict, fragments: Tuple[FrozenSet[str], str]) -> str:
+        supported, overview = fragments
+
+        # If a specific cryptocurrency was mentioned, check if we support it
+        if "cryptocurrency" in entities:
+            crypto = self._first_entity(entities, "cryptocurrency")
+            if crypto.lower() in supported:
+                return f"Yes, we do support {crypto.upper()}! You can trade it on our exchange."
+            return f"I'm sorry, we don't currently support {crypto.upper()} on our exchange. We regularly add new cryptocurrencies, so please check back for updates."
+
+        # Otherwise, give general information
+        return overview
+
+    def _prepare_fees(self, intent: str, kb_data: Dict) -> Tuple[str, Dict[str, str]]:
+        trading_fees = kb_data["trading"]
+        trading = f"Our trading fees are {trading_fees['maker']*100}% for maker orders and {trading_fees['taker']*100}% for taker orders. Volume discounts are available for high-volume traders."
+        withdrawal = {crypto: f"The withdrawal fee for {crypto} is {fee} {crypto}." for crypto, fee in kb_data["withdrawal"].items()}
+        return trading, withdrawal
+
+    def _render_fees(self, entities: Dict, fragments: Tuple[str, Dict[str, str]]) -> str:
+        trading, withdrawal = fragments
+
+        # If the user asked about a specific fee type
+        fee_type = entities.get("fee_type")
+        if fee_type == "trading":
+            return trading
+        if fee_type == "withdrawal":
+            # If they asked about a specific cryptocurrency's withdrawal fee
+            if "cryptocurrency" in entities:
+                crypto = self._first_entity(entities, "cryptocurrency").upper()
+                response = withdrawal.get(crypto)
+                if response is not None:
+                    return response
+                return f"I don't have the specific withdrawal fee for {crypto}. Please check our fee schedule on the website or contact support."
+            return "Our withdrawal fees vary by cryptocurrency. For example, BTC withdrawal fee is 0.0005 BTC. Would you like to know about a specific cryptocurrency's withdrawal fee?"
+
+        # General fee information
+        return "CryptoLocal Exchange offers competitive fees. Trading fees start at 0.1% maker / 0.15% taker with volume discounts available. Withdrawal fees vary by cryptocurrency. Would you like more specific information about a particular fee type?"
+
+    def _prepare_verification_info(self, intent: str, kb_data: Dict) -> Tuple[Dict, Dict[str, str]]:
+        # Tier summaries are filled in as tiers are asked about
+        return kb_data, {}
+
+    def _render_verification_info(self, entities: Dict, fragments: Tuple[Dict, Dict[str, str]]) -> str:
+        tiers, summaries = fragments
+
+        # If they asked about a specific tier
+        if "verification_tier" in entities:
+            tier = self._first_entity(entities, "verification_tier")
+            summary = summaries.get(tier)
+            if summary is not None:
+                return summary
+            if tier in tiers:
+                tier_info = tiers[tier]
+                requirements = ", ".join(tier_info["requirements"])
+                limits = tier_info["limits"]
+                summary = summaries[tier] = f"{tier.capitalize()} verification requires: {requirements}. With this level, your daily trading limit is ${limits['daily_trading']} and daily withdrawal limit is ${limits['daily_withdrawal']}."
+                return summary
+            return f"I don't have information about {tier}. Our verification levels include Tier 1 (Basic), Tier 2 (Verified), and Tier 3 (Enhanced)."
+
+        # General verification information
+        return "CryptoLocal Exchange has 3 verification tiers. Tier 1 (Basic) requires email and phone verification with a $2,000 daily limit. Tier 2 requires ID and proof of address with a $10,000 daily limit. Tier 3 adds a verification call with a $50,000 daily limit. Would you like more details about a specific tier?"
+
+    def _prepare_generic(self, intent: str, kb_data: Any) -> str:
+        """Summarize KB data - this is simplified and would be more sophisticated in a real system"""
+        if isinstance(kb_data, dict):
+            keys = list(kb_data.keys())[:3]  # Just use first few keys to avoid overwhelming
+            return f"Here's what I know about {intent.replace('_', ' ')}: " + ", ".join([f"{key}: {str(kb_data[key])[:50]}..." for key in keys])
+        elif isinstance(kb_data, list):
+            items = kb_data[:3]  # Just use first few items to avoid overwhelming
+            return f"Here's what I know about {intent.replace('_', ' ')}: " + ", ".join([str(item) for item in items])
+        else:
+            return f"About {intent.replace('_', ' ')}: {str(kb_data)}"
         
     def generate_flow_response(self, flow_name: str, flow_state: Dict) -> str:
         """Generate a response for an active conversation flow"""
-        if flow_name == "account_registration":
-            step = flow_state.get("step", 0)
-            if step == 0:
-                return "I'll help you create an account! First, could you provide your email address?"
-            elif step == 1:
-                return "Great! Now, please create a strong password. It should be at least 12 characters with letters, numbers, and special characters."
-            elif step == 2:
-                return "Now I'll need your full name
\ No newline at end of file
+        if flow_name in self.flows:
+            return self.flows.prompt(flow_name, flow_state)
+
+        # Fallback for flows without specific handling
+        return "Let's continue where we left off. What would you like to do next?"
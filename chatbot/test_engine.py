@@ -0,0 +1,76 @@
+import os
+
+from engine import ConversationEngine, REDACTED, REGISTRATION_FLOW
+from statemanager import StateManager
+from session_store import SQLiteSessionStore
+
+WEAK_PASSWORD = "weakpass"
+PASSWORD = "Str0ng!Passw0rd"
+
+
+def test_registration_password_is_not_kept(tmp_path):
+    history_dir = tmp_path / "history"
+    history_dir.mkdir()
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    state = StateManager(history_size=2, history_dir=str(history_dir), store=store)
+    engine = ConversationEngine(state_manager=state)
+
+    engine.process("u", "i want to create an account")
+    assert state.get_session("u").current_context == REGISTRATION_FLOW
+    engine.process("u", "bob@example.com")
+    engine.process("u", WEAK_PASSWORD)
+    engine.process("u", PASSWORD)
+    state.flush()  # The password turns are still in the in-memory history here
+    record = store.load("u")
+
+    engine.process("u", "Bob Smith")
+    result = engine.process("u", "France")
+    assert "account has been created" in result.response
+    # Push the password turns out of the 2-entry buffer into the spill file
+    engine.process("u", "what are your fees")
+    engine.process("u", "thanks")
+    state.close()
+
+    history = state.get_conversation_history("u", full=True)
+    messages = [entry.user_message for entry in history]
+    assert messages[:6] == ["i want to create an account", "bob@example.com", REDACTED, REDACTED,
+                            "Bob Smith", "France"]
+
+    spill_file = state.history_path("u")
+    assert os.path.exists(spill_file)
+    with open(spill_file, encoding="utf-8") as f:
+        spilled = f.read()
+    assert REDACTED in spilled
+    for secret in (WEAK_PASSWORD, PASSWORD):
+        assert secret not in spilled
+        assert secret.encode("utf-8") not in record
+        assert all(secret not in str(entry) for entry in history)
+    assert state.get_session("u").get_flow_state(REGISTRATION_FLOW).get("password") is None
+
+
+def test_registration_can_be_left():
+    engine = ConversationEngine(state_manager=StateManager())
+
+    engine.process("u", "i want to create an account")
+    result = engine.process("u", "cancel")
+    assert "cancelled the account registration" in result.response
+    assert engine.state.get_session("u").current_context is None
+
+    # A clear request for something else leaves the flow and is answered as usual
+    for text, intent in [("I want to talk to a human", "human_support"), ("help", "help"), ("bye", "farewell")]:
+        engine.process("u", "i want to create an account")
+        engine.process("u", "bob@example.com")
+        engine.process("u", PASSWORD)
+        result = engine.process("u", text)
+        assert result.intent == intent
+        session = engine.state.get_session("u")
+        assert not session.in_flow(REGISTRATION_FLOW)
+        assert session.get_flow_state(REGISTRATION_FLOW).get("full_name") is None
+
+    # Answers to the steps are still taken as answers
+    engine.process("u", "i want to create an account")
+    engine.process("u", "bob@example.com")
+    engine.process("u", PASSWORD)
+    engine.process("u", "Bob Smith")
+    result = engine.process("u", "France")
+    assert "account has been created" in result.response
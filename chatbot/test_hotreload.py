@@ -0,0 +1,64 @@
+import os
+import json
+import time
+
+from knowledge_base import KnowledgeBase
+from statemanager import PatternMatcher
+from hotreload import HotReloader
+
+
+def write_json(path, data):
+    # Replaced atomically, as HotReloader expects
+    temporary = str(path) + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def make_matcher(tmp_path):
+    patterns = PatternMatcher(KnowledgeBase()).patterns
+    path = tmp_path / "patterns.json"
+    write_json(path, patterns)
+    return PatternMatcher(KnowledgeBase(), patterns_path=str(path)), path, patterns
+
+
+def test_broken_files_keep_the_current_state(tmp_path):
+    matcher, path, patterns = make_matcher(tmp_path)
+    reloader = HotReloader(matcher)
+    state = matcher._state
+
+    bad_regex = json.loads(json.dumps(patterns))
+    bad_regex["greeting"]["patterns"].append("(unclosed")
+    missing_key = json.loads(json.dumps(patterns))
+    del missing_key["greeting"]["patterns"]
+    for broken in (bad_regex, missing_key, "not a dict"):
+        write_json(path, broken)
+        assert reloader.check() is False
+        assert matcher._state is state
+    assert reloader.failures == 3
+
+    patterns["greeting"]["patterns"].append(r"^howdy$")
+    write_json(path, patterns)
+    assert reloader.check() is True
+    assert reloader.reloads == 1
+    assert matcher.match_intent("howdy")[0] == "greeting"
+
+
+def test_watcher_survives_broken_files(tmp_path):
+    matcher, path, patterns = make_matcher(tmp_path)
+    reloader = HotReloader(matcher, interval=0.01)
+    reloader.start()
+    try:
+        write_json(path, {"greeting": {"patterns": ["(unclosed"]}})
+        deadline = time.monotonic() + 5
+        while not reloader.failures and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert reloader.failures == 1
+        assert reloader._thread.is_alive()
+
+        write_json(path, patterns)
+        while not reloader.reloads and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert reloader.reloads == 1
+    finally:
+        reloader.stop()
@@ -0,0 +1,70 @@
+import re
+import random
+import itertools
+
+import pytest
+
+from knowledge_base import KnowledgeBase, CATEGORIES
+
+
+def plain_walk(kb, query, categories=None):
+    """The recursive walk search used before the index: (path, value, depth) for each hit"""
+    query = query.lower()
+
+    def walk(data, path, depth):
+        if isinstance(data, dict):
+            for key, value in data.items():
+                new_path = f"{path}.{key}" if path else key
+                if query in key.lower():
+                    yield new_path, value, depth + 1
+                yield from walk(value, new_path, depth + 1)
+        elif isinstance(data, list):
+            for i, item in enumerate(data):
+                new_path = f"{path}[{i}]"
+                if isinstance(item, str) and query in item.lower():
+                    yield new_path, item, depth + 1
+                if isinstance(item, (dict, list)):
+                    yield from walk(item, new_path, depth + 1)
+        elif isinstance(data, str) and query in data.lower():
+            yield path, data, depth
+
+    for category in CATEGORIES:
+        if categories is None or category in categories:
+            yield from walk(getattr(kb, category), category, 0)
+
+
+def queries(kb):
+    words = sorted({word for category in CATEGORIES
+                    for _, _, text, _ in kb._get_search_index().entries for word in re.findall(r"\S+", text)})
+    rng = random.Random(5)
+    sample = rng.sample(words, 150)
+    return (["", " ", "a", "fe", "%", "2FA", "BTC", "fee", "ing", "24/7", "Bank transfer", "xyz", "qqqq", "zz"]
+            + sample + [word[1:4] for word in sample] + [word[:2] for word in sample[:30]])
+
+
+@pytest.fixture(scope="module", params=["memory", "file"])
+def kb(request, tmp_path_factory):
+    if request.param == "memory":
+        return KnowledgeBase()
+    path = str(tmp_path_factory.mktemp("kb") / "kb.bin")
+    KnowledgeBase().save(path)
+    return KnowledgeBase(path)
+
+
+def test_search_matches_plain_walk(kb):
+    for query in queries(kb):
+        expected = [{"path": path, "value": value} for path, value, _ in plain_walk(kb, query)]
+        assert kb.search(query) == expected, query
+
+
+def test_iter_search_options_match_plain_walk(kb):
+    options = itertools.product([None, 0, 1, 5], [None, ("exchange_info", "not_a_category"), ("trading_info", "crypto_education")],
+                                [None, 1, 2])
+    for limit, categories, max_depth in options:
+        for query in queries(kb)[::4]:
+            expected = [(path, value) for path, value, depth in plain_walk(kb, query, categories)
+                        if max_depth is None or depth <= max_depth]
+            if limit is not None:
+                expected = expected[:limit]
+            assert list(kb.iter_search(query, limit, categories, max_depth)) == expected, \
+                (query, limit, categories, max_depth)
@@ -0,0 +1,106 @@
+import re
+import random
+
+import pytest
+
+from knowledge_base import KnowledgeBase
+from statemanager import PatternMatcher, required_literals
+
+BASE_MESSAGES = [
+    "hi", "Hello!", "hey there", "good morning", "bye", "thanks bye", "thank you", "I really appreciate", "help",
+    "i need some help", "what can you do?", "I want to speak to a human", "live support please",
+    "what are the trading hours", "when is the exchange open", "are you open 24/7", "maintenance schedule",
+    "which coins do you support", "do you support solana", "list of supported coins", "trading pairs available",
+    "what are your fees", "withdrawal fees for btc", "how much are the fees to withdraw", "volume discounts",
+    "kyc requirements", "verification levels", "how to verify", "tell me about kyc steps", "how do i create an account",
+    "sign up process", "i want to open an account", "how can i secure my account", "2fa setup", "i forgot my password",
+    "password reset steps", "how do i buy bitcoin", "how to place an order", "explain limit orders",
+    "what is a whale in crypto", "meaning of hodl", "how do i deposit eth", "deposit instructions",
+    "how long for deposit confirmation", "how can i withdraw crypto", "withdrawal process",
+    "time to withdrawal processing", "how do i contact support", "support email", "do you have human support",
+    "having a problem with login", "issue with deposit", "what is blockchain", "how does bitcoin work",
+    "basics of crypto", "tips for trading", "how to read charts", "explain technical analysis", "", "   ",
+    "asdf qwer", "send 0.5 btc and 100 usdt", "tier 2 limits for 3 days", "level3 and 2 weeks",
+    "stop-limit order or market order", "trailing stop order", "canada solution ethical",
+    # Anchors inside longer words, and overlapping anchors
+    "withdrawal feesy", "feesfees", "helpful", "goodbyes", "accountant", "depositor", "feature fee",
+    # Non-ASCII characters that fold onto ASCII letters case-insensitively (long s, Kelvin sign)
+    "feeſ", "KYC requirements", "paſsword reset", "I want to talk to a person about withdrawal fees for eth",
+    "tier 2 days", "level 5 btc", "café fees", "naïve question about kyc",
+]
+CONTEXTS = [None, "greeting", "fees", "deposit", "account_registration"]
+
+
+def corpus(count=3000):
+    rng = random.Random(7)
+    words = sorted({word for message in BASE_MESSAGES for word in re.findall(r"[\w'/-]+", message.lower())})
+    words += ["the", "a", "my", "your", "to", "of", "!", "?", "."]
+    messages = list(BASE_MESSAGES)
+    for _ in range(count):
+        messages.append(" ".join(rng.choice(words) for _ in range(rng.randint(1, 9))))
+    for message in BASE_MESSAGES:
+        messages.append(message.upper())
+        messages.append("  " + message + " !!")
+    return messages
+
+
+def plain_scan(patterns, user_input, current_context):
+    """match_intent without any prefilter: every pattern of every intent is tried"""
+    best = None
+    for intent_name, intent_data in patterns.items():
+        if not intent_data.get("context_independent", False) and current_context != intent_name:
+            continue
+        for pattern in intent_data["patterns"]:
+            match = re.search(pattern, user_input, re.IGNORECASE)
+            if match:
+                confidence = (match.end() - match.start()) / len(user_input) * intent_data.get("priority", 1)
+                if best is None or confidence > best[1]:
+                    best = (intent_name, confidence)
+                break
+    return best or ("unknown", 0.0)
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return PatternMatcher(KnowledgeBase(), cache_size=0)
+
+
+def test_prefilter_matches_plain_scan(matcher):
+    compiled = matcher._state.compiled
+    mismatches = []
+    for message in corpus():
+        user_input = message.lower().strip()
+        for context in CONTEXTS:
+            expected = plain_scan(matcher.patterns, user_input, context)
+            if matcher._match_normalized(user_input, context, compiled) != expected:
+                mismatches.append((message, context))
+    assert not mismatches
+
+
+def test_required_literals_are_present_in_every_match(matcher):
+    messages = [message.lower().strip() for message in corpus()]
+    for intent_data in matcher.patterns.values():
+        for pattern in intent_data["patterns"]:
+            literals = required_literals(pattern)
+            if literals is None:
+                continue
+            compiled = re.compile(pattern, re.IGNORECASE)
+            for message in messages:
+                if compiled.search(message) and message.isascii():
+                    assert any(literal in message for literal in literals), (pattern, message)
+
+
+@pytest.mark.parametrize("message, anchors", [
+    ("withdrawal feesy", {"withdrawal", "fees"}),
+    ("feature fee", {"fee"}),
+    ("goodbyes", {"goodbye"}),
+])
+def test_anchor_scanner_finds_overlapping_anchors(matcher, message, anchors):
+    compiled = matcher._state.compiled
+    candidates = matcher._candidate_patterns(message, compiled)
+    for anchor in anchors:
+        assert compiled.anchor_patterns[anchor] <= candidates
+
+
+def test_non_ascii_input_bypasses_the_prefilter(matcher):
+    assert matcher._candidate_patterns("feeſ", matcher._state.compiled) is None
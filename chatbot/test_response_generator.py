@@ -0,0 +1,133 @@
+import random
+import itertools
+
+import pytest
+
+from knowledge_base import KnowledgeBase
+from statemanager import PatternMatcher, ResponseGenerator
+
+
+def plain_response(templates, intent, entities, kb_info):
+    """get_response as an if/elif chain, without dispatch table or caches"""
+    if intent in templates:
+        choices = templates[intent]
+        if isinstance(choices, list) and all(isinstance(t, str) for t in choices):
+            return random.choice(choices)
+
+    def first(entity_type):
+        value = entities[entity_type]
+        return value[0] if isinstance(value, list) else value
+
+    if intent == "trading_hours":
+        data = kb_info["kb_data"]
+        return f"CryptoLocal Exchange is open for trading {data['trading']}. Our scheduled maintenance window is {data['maintenance']}."
+    elif intent == "supported_crypto":
+        cryptos = kb_info["kb_data"]["major_cryptos"]
+        stablecoins = kb_info["kb_data"]["stablecoins"]
+        if "cryptocurrency" in entities:
+            crypto = first("cryptocurrency")
+            if crypto.lower() in [c.lower() for c in cryptos + stablecoins]:
+                return f"Yes, we do support {crypto.upper()}! You can trade it on our exchange."
+            return f"I'm sorry, we don't currently support {crypto.upper()} on our exchange. We regularly add new cryptocurrencies, so please check back for updates."
+        return f"CryptoLocal Exchange supports major cryptocurrencies including {', '.join(cryptos[:3])} and more. We also support stablecoins such as {', '.join(stablecoins[:2])}. Would you like to see the full list of supported cryptocurrencies?"
+    elif intent == "fees":
+        trading_fees = kb_info["kb_data"]["trading"]
+        withdrawal = kb_info["kb_data"]["withdrawal"]
+        if "fee_type" in entities:
+            if entities["fee_type"] == "trading":
+                return f"Our trading fees are {trading_fees['maker']*100}% for maker orders and {trading_fees['taker']*100}% for taker orders. Volume discounts are available for high-volume traders."
+            elif entities["fee_type"] == "withdrawal":
+                if "cryptocurrency" in entities:
+                    crypto = first("cryptocurrency").upper()
+                    if crypto in withdrawal:
+                        return f"The withdrawal fee for {crypto} is {withdrawal[crypto]} {crypto}."
+                    return f"I don't have the specific withdrawal fee for {crypto}. Please check our fee schedule on the website or contact support."
+                return "Our withdrawal fees vary by cryptocurrency. For example, BTC withdrawal fee is 0.0005 BTC. Would you like to know about a specific cryptocurrency's withdrawal fee?"
+        return "CryptoLocal Exchange offers competitive fees. Trading fees start at 0.1% maker / 0.15% taker with volume discounts available. Withdrawal fees vary by cryptocurrency. Would you like more specific information about a particular fee type?"
+    elif intent == "verification_info":
+        tiers = kb_info["kb_data"]
+        if "verification_tier" in entities:
+            tier = first("verification_tier")
+            if tier in tiers:
+                requirements = ", ".join(tiers[tier]["requirements"])
+                limits = tiers[tier]["limits"]
+                return f"{tier.capitalize()} verification requires: {requirements}. With this level, your daily trading limit is ${limits['daily_trading']} and daily withdrawal limit is ${limits['daily_withdrawal']}."
+            return f"I don't have information about {tier}. Our verification levels include Tier 1 (Basic), Tier 2 (Verified), and Tier 3 (Enhanced)."
+        return "CryptoLocal Exchange has 3 verification tiers. Tier 1 (Basic) requires email and phone verification with a $2,000 daily limit. Tier 2 requires ID and proof of address with a $10,000 daily limit. Tier 3 adds a verification call with a $50,000 daily limit. Would you like more details about a specific tier?"
+
+    if kb_info and "kb_data" in kb_info:
+        data = kb_info["kb_data"]
+        name = intent.replace("_", " ")
+        if isinstance(data, dict):
+            return f"Here's what I know about {name}: " + ", ".join(f"{key}: {str(data[key])[:50]}..." for key in list(data)[:3])
+        elif isinstance(data, list):
+            return f"Here's what I know about {name}: " + ", ".join(str(item) for item in data[:3])
+        return f"About {name}: {data}"
+    return "I understand you're asking about " + intent.replace("_", " ") + ". Let me look into that for you."
+
+
+ENTITY_SETS = [
+    {}, {"cryptocurrency": "btc"}, {"cryptocurrency": ["eth", "btc"]}, {"cryptocurrency": "doge"},
+    {"fee_type": "trading"}, {"fee_type": "withdrawal"}, {"fee_type": "withdrawal", "cryptocurrency": "sol"},
+    {"fee_type": "withdrawal", "cryptocurrency": ["doge", "btc"]}, {"fee_type": "other"},
+    {"verification_tier": "tier2"}, {"verification_tier": ["tier3", "tier1"]}, {"verification_tier": "tier9"},
+]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return PatternMatcher(KnowledgeBase())
+
+
+def test_several_tiers_answer_the_first(matcher):
+    generator = ResponseGenerator(matcher.kb)
+    text = "verification levels for tier 1 and tier 2"
+    intent, _ = matcher.match_intent(text)
+    entities = matcher.extract_entities(text)
+    assert entities["verification_tier"] == ["tier1", "tier2"]
+    response = generator.get_response(intent, entities, matcher.get_knowledge_base_info(intent))
+    assert response.startswith("Tier1 verification requires")
+
+
+def assert_answers_like_plain(generator, intents, kb_info):
+    for intent, entities in itertools.product(intents, ENTITY_SETS):
+        # Twice, so the second answer can come from the cache
+        for seed in (3, 3, 4):
+            info = kb_info(intent)
+            random.seed(seed)
+            expected = plain_response(generator.templates, intent, entities, info)
+            random.seed(seed)
+            assert generator.get_response(intent, entities, info) == expected, (intent, entities)
+
+
+def test_answers_like_plain_chain(matcher):
+    generator = ResponseGenerator(matcher.kb)
+    intents = list(matcher.patterns) + ["unknown", "nonexistent_intent"]
+    assert_answers_like_plain(generator, intents, matcher.get_knowledge_base_info)
+
+    # Other KB data shapes for the generic answer
+    for info in (None, {"kb_data": [1, 2, 3, 4]}, {"kb_data": "text"}):
+        assert_answers_like_plain(generator, ["nonexistent_intent"], lambda intent: info)
+
+
+def test_reload_drops_cached_responses(matcher):
+    generator = ResponseGenerator(matcher.kb)
+    intents = ["fees", "verification_info", "supported_crypto", "trading_hours", "deposit_info"]
+    assert_answers_like_plain(generator, intents, matcher.get_knowledge_base_info)
+
+    # A reloaded knowledge base hands out new objects with different values
+    kb_info = {intent: dict(matcher.get_knowledge_base_info(intent)) for intent in intents}
+    fees = kb_info["fees"]["kb_data"] = dict(kb_info["fees"]["kb_data"])
+    fees["withdrawal"] = {crypto: fee * 2 for crypto, fee in fees["withdrawal"].items()}
+    tiers = kb_info["verification_info"]["kb_data"] = dict(kb_info["verification_info"]["kb_data"])
+    tiers["tier2"] = dict(tiers["tier2"], requirements=["Passport"])
+    crypto = kb_info["supported_crypto"]["kb_data"] = dict(kb_info["supported_crypto"]["kb_data"])
+    crypto["major_cryptos"] = ["DOGE"] + crypto["major_cryptos"]
+    hours = kb_info["trading_hours"]["kb_data"] = dict(kb_info["trading_hours"]["kb_data"])
+    hours["trading"] = "on weekdays"
+    kb_info["deposit_info"]["kb_data"] = {"note": "first key", **kb_info["deposit_info"]["kb_data"]}
+
+    generator.reload(KnowledgeBase())
+    assert_answers_like_plain(generator, intents, kb_info.get)
+    assert "Passport" in generator.get_response("verification_info", {"verification_tier": "tier2"},
+                                                kb_info["verification_info"])
@@ -0,0 +1,108 @@
+import json
+import asyncio
+
+from engine import ConversationEngine
+from server import ChatServer
+
+
+class FailingEngine(ConversationEngine):
+    """Raises for the message "boom" """
+
+    def process(self, user_id, text):
+        if text == "boom":
+            raise RuntimeError("boom")
+        return super().process(user_id, text)
+
+
+async def post_chat(reader, writer, user_id, message):
+    body = json.dumps({"user_id": user_id, "message": message}).encode("utf-8")
+    writer.write(f"POST /chat HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = int(next(line.split(":", 1)[1] for line in head.decode("latin-1").split("\r\n")
+                      if line.lower().startswith("content-length")))
+    return int(head.split(b" ", 2)[1]), json.loads(await reader.readexactly(length))
+
+
+def test_failing_message_only_fails_its_own_request():
+    async def run():
+        # A long batch delay puts both requests into the same batch
+        server = ChatServer(FailingEngine(), port=0, max_delay=0.05)
+        await server.start()
+        try:
+            connections = [await asyncio.open_connection("127.0.0.1", server.port) for _ in range(2)]
+            (bad_status, bad), (good_status, good) = await asyncio.gather(
+                post_chat(*connections[0], "a", "boom"),
+                post_chat(*connections[1], "b", "hello"))
+            assert server.batcher.batches == 1
+            assert bad_status == 500 and bad == {"error": "Internal Server Error"}
+            assert good_status == 200 and good["intent"] == "greeting"
+
+            # The connection that got the 500 is still usable
+            status, payload = await post_chat(*connections[0], "a", "hello")
+            assert status == 200 and payload["intent"] == "greeting"
+            for _, writer in connections:
+                writer.close()
+        finally:
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_process_batch_returns_errors_per_message():
+    engine = FailingEngine()
+    results = engine.process_batch([("a", "i want to create an account"), ("b", "boom"), ("a", "bob@example.com")])
+    assert isinstance(results[1], RuntimeError)
+    assert results[0].intent == "create_account"
+    # The first message's flow step wasn't lost with the batch
+    assert results[2].intent == "account_registration"
+
+
+def test_server_sweeps_expired_sessions():
+    async def run():
+        server = ChatServer(port=0, sweep_interval=0.01, max_session_age=0)
+        state = server.engine.state
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            status, _ = await post_chat(reader, writer, "a", "hello")
+            assert status == 200
+            writer.close()
+            for _ in range(500):
+                if not state.session_count():
+                    break
+                await asyncio.sleep(0.01)
+            assert state.session_count() == 0
+        finally:
+            await server.stop()
+        assert state._sweeper is None
+
+    asyncio.run(run())
+
+
+def test_bad_bodies_dont_crash_the_handler(caplog):
+    async def run():
+        server = ChatServer(port=0)
+        await server.start()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(b"POST /chat HTTP/1.1\r\nHost: test\r\nContent-Length: -5\r\n\r\n")
+            head = await reader.readuntil(b"\r\n\r\n")
+            assert head.startswith(b"HTTP/1.1 400 ")
+            writer.close()
+
+            # The client goes away halfway through the body
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            writer.write(b"POST /chat HTTP/1.1\r\nHost: test\r\nContent-Length: 100\r\n\r\n{\"user_id\"")
+            writer.write_eof()
+            assert await reader.read() == b""
+            writer.close()
+
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            status, payload = await post_chat(reader, writer, "a", "hello")
+            assert status == 200 and payload["intent"] == "greeting"
+            writer.close()
+        finally:
+            await server.stop()
+
+    asyncio.run(run())
+    assert not [record for record in caplog.records if record.levelname == "ERROR"]
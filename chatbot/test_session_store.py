@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from statemanager import StateManager
+from session_store import (SessionStore, MemorySessionStore, SQLiteSessionStore, FileSessionStore,
+                           decode_session)
+
+
+def test_incomplete_backend_fails_on_creation():
+    class LoadOnly(SessionStore):
+        def load(self, user_id):
+            return None
+
+    with pytest.raises(TypeError):
+        LoadOnly()
+
+
+@pytest.mark.parametrize("make_store", [
+    lambda tmp_path: MemorySessionStore(),
+    lambda tmp_path: SQLiteSessionStore(str(tmp_path / "sessions.db")),
+    lambda tmp_path: FileSessionStore(str(tmp_path / "sessions")),
+], ids=["memory", "sqlite", "file"])
+def test_backends_round_trip(tmp_path, make_store):
+    store = make_store(tmp_path)
+    try:
+        store.save_many([("a", 100.0, b"old"), ("b", 200.0, b"data")])
+        store.save_many([("a", 300.0, b"new")])
+        assert store.load("a") == b"new"
+        assert store.load("missing") is None
+        assert store.delete_expired(250.0) == 1
+        assert store.load("b") is None
+        assert store.load("a") == b"new"
+    finally:
+        store.close()
+
+
+class FlakyStore(MemorySessionStore):
+    """Fails the next `failures` writes"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def save_many(self, items):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("database is locked")
+        super().save_many(items)
+
+
+def test_failed_flush_keeps_changes_pending():
+    store = FlakyStore(failures=1)
+    state = StateManager(store=store)
+    state.set_last_intent("a", "fees")
+    with pytest.raises(OSError):
+        state.flush()
+    assert store.load("a") is None
+
+    assert state.flush() == 1
+    assert decode_session(store.load("a"), 20).last_intent == "fees"
+
+
+def test_sweeper_survives_store_errors():
+    store = FlakyStore(failures=2)
+    state = StateManager(store=store)
+    state.set_last_intent("a", "fees")
+    state.start_sweeper(interval=0.01)
+    try:
+        deadline = time.monotonic() + 5
+        while store.load("a") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert state._sweeper.is_alive()
+        assert decode_session(store.load("a"), 20).last_intent == "fees"
+    finally:
+        state.stop_sweeper()
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from engine import TurnResult
+from workers import WorkerPool
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="WorkerPool needs os.fork")
+
+
+def echo_handler():
+    def handle(user_id, text):
+        if text == "boom":
+            raise ValueError("boom")
+        return TurnResult("echo", 1.0, {}, f"{user_id}: {text}")
+    return handle
+
+
+def test_failing_message_only_fails_its_own_position():
+    messages = [(f"user-{number}", "boom" if number == 3 else "hi") for number in range(20)]
+    with WorkerPool(echo_handler, 2, freeze=False) as pool:
+        # The failing user's worker also answers other users in this batch
+        assert len({pool.worker_for(user_id) for user_id, _ in messages}) == 2
+        results = pool.process_batch(messages)
+
+        for number, result in enumerate(results):
+            if number == 3:
+                assert isinstance(result, RuntimeError)
+                assert "ValueError: boom" in str(result)
+            else:
+                assert result.response == f"user-{number}: hi"
+
+        with pytest.raises(RuntimeError, match="boom"):
+            pool.process("user-3", "boom")
+        assert pool.process("user-3", "hi").response == "user-3: hi"
+
+
+def test_dead_worker_only_fails_its_own_users():
+    import signal
+
+    with WorkerPool(echo_handler, 2, freeze=False) as pool:
+        users = {}
+        for number in range(50):
+            users.setdefault(pool.worker_for(f"user-{number}"), f"user-{number}")
+        alive, dead = users[0], users[1]
+
+        os.kill(pool.pids[1], signal.SIGKILL)
+        os.waitpid(pool.pids[1], 0)
+
+        results = pool.process_batch([(alive, "c"), (dead, "d")])
+        assert results[0].response == f"{alive}: c"
+        assert isinstance(results[1], RuntimeError)
+
+        # No reply is left over to be taken for the answer of a later message
+        for text in ("e", "f"):
+            results = pool.process_batch([(alive, text), (dead, text)])
+            assert results[0].response == f"{alive}: {text}"
+            assert isinstance(results[1], RuntimeError)
+        assert pool.process(alive, "g").response == f"{alive}: g"
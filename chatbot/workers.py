@@ -0,0 +1,260 @@
+"""
+Pre-fork worker pool for the chatbots
+
+Pattern matching is CPU-bound and holds the GIL, so one process answers messages
+on one core. WorkerPool builds the bot once in the parent, which loads the
+knowledge base and compiles the patterns, then forks worker processes that share
+it copy-on-write. Messages are routed by a hash of the user id, so the sessions
+of a user always live in the same worker. POSIX only, since it relies on fork.
+"""
+import os
+import gc
+import sys
+import zlib
+import random
+import asyncio
+import threading
+from multiprocessing.connection import Connection, Pipe
+from typing import Any, Callable, List, Tuple, Optional
+
+from engine import ConversationEngine, TurnResult
+
+# Takes (user_id, text) and returns the answer, must return something picklable
+Handler = Callable[[str, str], Any]
+
+
+def engine_handler(sweep_interval: Optional[float] = 60.0, max_session_age: float = 24) -> Handler:
+    """
+    Handler factory answering with a ConversationEngine, returns TurnResults
+
+    Args:
+        sweep_interval: Seconds between removals of expired sessions in each worker, None for never
+        max_session_age: Hours of inactivity after which a session is removed
+    """
+    engine = ConversationEngine()
+    started = False
+
+    def handle(user_id: str, text: str) -> TurnResult:
+        nonlocal started
+        if not started:
+            # Threads don't survive the fork, so each worker starts its sweeper on its first message
+            if sweep_interval:
+                engine.state.start_sweeper(sweep_interval, max_session_age)
+            started = True
+        return engine.process(user_id, text)
+
+    return handle
+
+
+def rulebased_handler() -> Handler:
+    """Handler factory answering with simplerulebased.RuleBasedChatbot, returns TurnResults"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if root not in sys.path:
+        sys.path.append(root)
+    from simplerulebased import RuleBasedChatbot
+
+    respond = RuleBasedChatbot().respond
+
+    def handle(user_id: str, text: str) -> TurnResult:
+        return TurnResult("rule", 1.0, {}, respond(text))
+
+    return handle
+
+
+HANDLER_FACTORIES = {
+    "engine": engine_handler,
+    "rules": rulebased_handler,
+}
+
+
+class WorkerPool:
+    """
+    Answers messages on forked worker processes
+
+    The handler factory runs once, in the parent. Everything it creates is then
+    moved out of the garbage collector's reach with gc.freeze() before forking:
+    collections in the workers would otherwise write to the headers of every
+    object and copy the shared pages one by one. The objects stay frozen, in the
+    parent as well, so create the pool once at startup. The factory must not start
+    threads, they don't survive the fork, and the pool must be created before an
+    event loop is running.
+
+    process_batch() sends each worker its share of a batch at once, so the workers
+    run in parallel, and a user's messages keep their order. handle_batch() does the
+    same from asyncio, so a pool can stand in for a ConversationEngine in ChatServer.
+    """
+
+    def __init__(self, handler_factory: Callable[[], Handler] = engine_handler, workers: int = None,
+                 freeze: bool = True):
+        """
+        Args:
+            handler_factory: Builds the handler in the parent before forking
+            workers: Number of worker processes, one per available CPU if omitted
+            freeze: Freeze the parent's objects before forking so they stay shared
+        """
+        if not hasattr(os, "fork"):
+            raise RuntimeError("WorkerPool needs os.fork, which isn't available on this platform")
+        if workers is None:
+            workers = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        self.workers = workers
+        self.pids: List[int] = []
+        self._connections: List[Optional[Connection]] = []  # None for a worker that exited
+        self._lock = threading.Lock()
+
+        handler = handler_factory()
+        if freeze:
+            gc.collect()
+            gc.freeze()
+        try:
+            for number in range(self.workers):
+                parent_end, child_end = Pipe()
+                pid = os.fork()
+                if pid == 0:
+                    parent_end.close()
+                    for connection in self._connections:
+                        connection.close()
+                    self._serve(handler, child_end)
+                child_end.close()
+                self.pids.append(pid)
+                self._connections.append(parent_end)
+        except BaseException:
+            self.close()
+            raise
+
+    @staticmethod
+    def _serve(handler: Handler, connection: Connection) -> None:
+        """Worker loop: answer batches until the pool closes, never returns"""
+        status = 0
+        random.seed()  # Otherwise every worker picks the same "random" responses
+        try:
+            while True:
+                try:
+                    batch = connection.recv()
+                except EOFError:
+                    break
+                if batch is None:
+                    break
+                # (True, answer) or (False, error) per message, so one failing message
+                # doesn't take the answers of the others with it
+                results = []
+                for user_id, text in batch:
+                    try:
+                        results.append((True, handler(user_id, text)))
+                    except Exception as e:
+                        results.append((False, f"{type(e).__name__}: {e}"))
+                try:
+                    connection.send(results)
+                except OSError:
+                    raise
+                except Exception as e:
+                    # An answer that can't be pickled, nothing has been sent yet
+                    connection.send([(False, f"{type(e).__name__}: {e}")] * len(batch))
+        except BaseException:
+            status = 1
+        finally:
+            os._exit(status)
+
+    def worker_for(self, user_id: str) -> int:
+        """Number of the worker handling a user"""
+        return zlib.crc32(user_id.encode("utf-8")) % self.workers
+
+    def process(self, user_id: str, text: str) -> Any:
+        """
+        Answer one message
+
+        Raises:
+            RuntimeError: If the handler failed on the message or the worker exited
+        """
+        result = self.process_batch([(user_id, text)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def process_batch(self, messages: List[Tuple[str, str]]) -> List[Any]:
+        """
+        Answer (user_id, text) messages, in parallel across workers
+
+        Like ConversationEngine.process_batch, a message that fails doesn't affect the
+        others: its position holds a RuntimeError describing the failure instead of
+        an answer. That includes the messages of a worker that exited; it isn't
+        replaced, so the messages of its users keep failing.
+        """
+        if not self._connections:
+            raise RuntimeError("The worker pool is closed")
+        shares: List[List[Tuple[str, str]]] = [[] for _ in range(self.workers)]
+        positions: List[List[int]] = [[] for _ in range(self.workers)]
+        for position, (user_id, text) in enumerate(messages):
+            number = self.worker_for(user_id)
+            shares[number].append((user_id, text))
+            positions[number].append(position)
+
+        results: List[Any] = [None] * len(messages)
+
+        def fail(number: int, error: str) -> None:
+            for position in positions[number]:
+                results[position] = RuntimeError(f"Worker {number} failed: {error}")
+
+        with self._lock:
+            sent = []
+            try:
+                for number in range(self.workers):
+                    if not shares[number]:
+                        continue
+                    connection = self._connections[number]
+                    if connection is None:
+                        fail(number, "exited")
+                        continue
+                    try:
+                        connection.send(shares[number])
+                    except OSError:
+                        self._lost(number)
+                        fail(number, "exited")
+                        continue
+                    sent.append(number)
+            finally:
+                # Every worker that got its share replies, and a reply left unread would be
+                # taken as the answer to the next batch, so read them all whatever happens
+                for number in sent:
+                    try:
+                        answers = self._connections[number].recv()
+                    except (EOFError, OSError):
+                        self._lost(number)
+                        fail(number, "exited")
+                        continue
+                    for position, (ok, answer) in zip(positions[number], answers):
+                        results[position] = answer if ok else RuntimeError(f"Worker {number} failed: {answer}")
+        return results
+
+    def _lost(self, number: int) -> None:
+        """Forget the connection to a worker that exited, its users' messages fail from now on"""
+        self._connections[number].close()
+        self._connections[number] = None
+
+    async def handle_batch(self, messages: List[Tuple[str, str]]) -> List[Any]:
+        """Answer (user_id, text) messages from asyncio, see process_batch"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.process_batch, messages)
+
+    def close(self) -> None:
+        """Stop the workers and wait for them to exit"""
+        for connection in self._connections:
+            if connection is None:
+                continue
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
+        self._connections = []
+        for pid in self.pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids = []
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
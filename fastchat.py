@@ -0,0 +1,416 @@
+import re
+import sys
+import random
+import importlib
+from collections import Counter
+from typing import List, Tuple, Optional, FrozenSet, NamedTuple, Iterable
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants  # Python 3.11+
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+# Same as nltk.chat.util.reflections, so the module works without NLTK installed
+reflections = {
+    "i am": "you are",
+    "i was": "you were",
+    "i": "you",
+    "i'm": "you are",
+    "i'd": "you would",
+    "i've": "you have",
+    "i'll": "you will",
+    "my": "your",
+    "you are": "I am",
+    "you were": "I was",
+    "you've": "I have",
+    "you'll": "I will",
+    "your": "my",
+    "yours": "mine",
+    "you": "me",
+    "me": "you",
+}
+
+
+class FastChat:
+    """
+    Drop-in replacement for nltk.chat.util.Chat
+
+    Takes the same pairs and reflections and answers the same way: the first pattern
+    that matches at the start of the message (case-insensitively) wins, a random one of
+    its responses is picked, %N is replaced by group N with reflections applied, and
+    "?." / "??" endings are fixed. Instead of trying the patterns one by one, they
+    are combined into one alternation that is matched once, and responses are split
+    at their %N references up front.
+
+    The one difference: text substituted for %N isn't scanned for "%" again, where
+    nltk would try to expand a "%" in the user's own message.
+    """
+
+    def __init__(self, pairs, reflections=None):
+        """
+        Args:
+            pairs: [pattern, [response, ...]] rules, in priority order
+            reflections: Words to swap in %N substitutions, e.g. "i am" -> "you are"
+        """
+        self._reflections = reflections or {}
+        self._reflection_pattern = self._compile_reflections(self._reflections) if self._reflections else None
+        self._responses = [tuple(_split_response(response) for response in responses)
+                           for _, responses in pairs]
+        self._patterns = [re.compile(pattern, re.IGNORECASE) for pattern, _ in pairs]
+        self._combined, self._rules = self._combine(self._patterns)
+
+    @staticmethod
+    def _compile_reflections(reflections):
+        # Longest first, so "i am" is swapped as a whole before "i"
+        words = sorted(reflections, key=len, reverse=True)
+        return re.compile(r"\b({})\b".format("|".join(map(re.escape, words))), re.IGNORECASE)
+
+    @staticmethod
+    def _combine(patterns):
+        """
+        Build one regex matching (p0)|(p1)|... and the (rule index, group offset) of each
+        alternative by the number of its wrapping group
+
+        Returns (None, None) when a pattern can't be embedded, e.g. because it uses
+        named groups or backreferences, and patterns are then tried one by one.
+        """
+        if not patterns or not all(_embeddable(pattern) for pattern in patterns):
+            return None, None
+
+        rules = {}
+        parts = []
+        offset = 0
+        for index, pattern in enumerate(patterns):
+            offset += 1
+            rules[offset] = (index, offset)
+            parts.append(f"({pattern.pattern})")
+            offset += pattern.groups
+        try:
+            combined = re.compile("|".join(parts), re.IGNORECASE)
+        except re.error:
+            return None, None
+        return combined, rules
+
+    def _substitute(self, text):
+        if self._reflection_pattern is None:
+            return text.lower()
+        reflections = self._reflections
+        return self._reflection_pattern.sub(lambda match: reflections[match.group(0)], text.lower())
+
+    def match(self, text):
+        """
+        Find the rule answering a message
+
+        Returns:
+            (rule index, match object, offset of the rule's groups in the match), or None.
+            Group N of the rule is group offset + N of the match, for N > 0.
+        """
+        if self._combined is not None:
+            match = self._combined.match(text)
+            if match is None:
+                return None
+            # The alternative's wrapping group is the last group to close
+            index, offset = self._rules[match.lastindex]
+            return index, match, offset
+
+        for index, pattern in enumerate(self._patterns):
+            match = pattern.match(text)
+            if match:
+                return index, match, 0
+        return None
+
+    def respond(self, str):
+        """
+        Generate a response to the user input
+
+        Returns:
+            The response, or None if no pattern matches
+        """
+        found = self.match(str)
+        if found is None:
+            return None
+        index, match, offset = found
+
+        resp = random.choice(self._responses[index])  # pick a random response
+        if isinstance(resp, tuple):
+            resp = "".join([self._substitute(match.group(offset + part if part else 0)) if isinstance(part, int)
+                            else part for part in resp])
+
+        # fix munged punctuation at the end
+        if resp[-2:] == "?.":
+            resp = resp[:-2] + "."
+        if resp[-2:] == "??":
+            resp = resp[:-2] + "?"
+        return resp
+
+
+def _split_response(response):
+    """
+    Split a response into literal strings and the group numbers of its %N references
+
+    Responses without references are returned as they are.
+    """
+    if "%" not in response:
+        return response
+    parts = []
+    start = 0
+    position = response.find("%")
+    while position >= 0:
+        number = response[position + 1:position + 2]
+        if not number.isdigit():
+            raise ValueError(f"'%' must be followed by a group number in response {response!r}")
+        parts.append(response[start:position])
+        parts.append(int(number))
+        start = position + 2
+        position = response.find("%", start)
+    parts.append(response[start:])
+    return tuple(part for part in parts if part != "")
+
+
+def _embeddable(pattern):
+    """Whether a pattern behaves the same inside a larger alternation"""
+    if pattern.groupindex:
+        return False  # Named groups could clash between patterns
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except re.error:
+        return False
+    return not _has_node(parsed, (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS))
+
+
+class RuleIssue(NamedTuple):
+    """A rule that can never, or only partly, answer a message"""
+    index: int  # Position in the original table
+    pattern: str
+    kind: str  # "unreachable", "duplicate", "shadowed" or "partially shadowed"
+    by: Tuple[int, ...]  # Earlier rules answering the messages instead
+    detail: str
+
+
+class RuleAnalysis(NamedTuple):
+    """Result of analyze_pairs"""
+    pairs: List  # Pruned and reordered table, answers exactly like the original
+    order: Tuple[int, ...]  # Original position of each rule in pairs
+    issues: Tuple[RuleIssue, ...]
+
+    def report(self) -> str:
+        total = len(self.order) + sum(issue.kind != "partially shadowed" for issue in self.issues)
+        lines = [f"{total} rules, {len(self.order)} kept, {total - len(self.order)} removed"]
+        for issue in self.issues:
+            lines.append(f"  rule {issue.index} {issue.pattern!r}: {issue.kind}, {issue.detail}")
+        if list(self.order) != sorted(self.order):
+            lines.append(f"  order: {', '.join(map(str, self.order))}")
+        return "\n".join(lines)
+
+
+class _Rule(NamedTuple):
+    index: int
+    pattern: re.Pattern
+    # Lowercase literal prefixes the rule matches exactly the messages starting with,
+    # None when the rule isn't a plain literal pattern
+    prefixes: Optional[FrozenSet[str]]
+    universal: bool  # Matches every message
+    asserts: bool  # Uses anchors, lookarounds or backreferences
+
+
+def analyze_pairs(pairs, sample: Optional[Iterable[str]] = None) -> RuleAnalysis:
+    """
+    Find rules of a Chat/FastChat pairs table that can never answer a message
+
+    Since the first matching rule wins, a rule is removed when the rules before it
+    already match everything it matches: after a catch-all like (.*), because an
+    earlier rule has the same pattern, or when each message it matches starts with a
+    literal an earlier rule matches. Rules are only moved when they can't match the
+    same message, so the table still answers every message the same way. With
+    sample messages, such rules are put in order of how many of them they answer.
+
+    Args:
+        pairs: [pattern, [response, ...]] rules, in priority order
+        sample: Optional typical messages used to order rules by hits
+    """
+    kept: List[_Rule] = []
+    issues: List[RuleIssue] = []
+    catch_all: Optional[_Rule] = None
+    for index, (pattern, _) in enumerate(pairs):
+        rule = _analyze_rule(index, re.compile(pattern, re.IGNORECASE))
+        if catch_all is not None:
+            issues.append(RuleIssue(index, pattern, "unreachable", (catch_all.index,),
+                                    f"rule {catch_all.index} {catch_all.pattern.pattern!r} matches every message"))
+            continue
+
+        duplicate = next((earlier for earlier in kept if earlier.pattern.pattern == pattern), None)
+        if duplicate is not None:
+            issues.append(RuleIssue(index, pattern, "duplicate", (duplicate.index,),
+                                    f"same pattern as rule {duplicate.index}"))
+            continue
+
+        if rule.prefixes is not None:
+            covering = {prefix: _covering_rule(prefix, kept) for prefix in sorted(rule.prefixes)}
+            by = tuple(sorted({earlier.index for earlier in covering.values() if earlier is not None}))
+            if all(covering.values()):
+                issues.append(RuleIssue(index, pattern, "shadowed", by,
+                                        f"everything it matches is matched by rule{'s' if len(by) > 1 else ''} "
+                                        f"{', '.join(map(str, by))} first"))
+                continue
+            if by:
+                dead = [prefix for prefix, earlier in covering.items() if earlier is not None]
+                issues.append(RuleIssue(index, pattern, "partially shadowed", by,
+                                        f"messages starting with {', '.join(map(repr, dead))} are answered by "
+                                        f"rule{'s' if len(by) > 1 else ''} {', '.join(map(str, by))}"))
+
+        kept.append(rule)
+        if rule.universal:
+            catch_all = rule
+
+    hits = Counter()
+    for message in sample or ():
+        for rule in kept:
+            if rule.pattern.match(message):
+                hits[rule.index] += 1
+                break
+
+    order = []
+    for block in _disjoint_blocks(kept):
+        order.extend(sorted((rule.index for rule in block), key=lambda index: -hits[index]))
+    return RuleAnalysis([pairs[index] for index in order], tuple(order), tuple(issues))
+
+
+def _analyze_rule(index: int, pattern: re.Pattern) -> _Rule:
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except re.error:
+        return _Rule(index, pattern, None, False, True)
+    asserts = _has_node(parsed, (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT,
+                                 sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS))
+    # Without assertions, a pattern that can match nothing matches at the start of any message
+    universal = not asserts and pattern.match("") is not None
+    prefixes = None if asserts else _literal_prefixes(parsed)
+    return _Rule(index, pattern, prefixes, universal, asserts)
+
+
+def _literal_prefixes(parsed, limit: int = 256) -> Optional[FrozenSet[str]]:
+    """
+    The shortest literals a pattern made only of literals, alternations, character
+    sets of literals and small bounded repeats can match, lowercased
+
+    re.match only anchors at the start, so such a pattern matches exactly the
+    messages starting with one of them.
+    """
+    strings = _expand(parsed, limit)
+    if strings is None:
+        return None
+    strings = sorted({string.lower() for string in strings}, key=len)
+    prefixes = []
+    for string in strings:
+        if not any(string.startswith(prefix) for prefix in prefixes):
+            prefixes.append(string)
+    return frozenset(prefixes)
+
+
+def _expand(parsed, limit):
+    results = {""}
+    for op, av in parsed:
+        if op is sre_constants.LITERAL:
+            options = {chr(av)}
+        elif op is sre_constants.IN:
+            if not all(item_op is sre_constants.LITERAL for item_op, _ in av):
+                return None
+            options = {chr(value) for _, value in av}
+        elif op is sre_constants.BRANCH:
+            options = set()
+            for branch in av[1]:
+                expanded = _expand(branch, limit)
+                if expanded is None:
+                    return None
+                options |= expanded
+        elif op is sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, subpattern = av
+            if add_flags or del_flags:
+                return None
+            options = _expand(subpattern, limit)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, subpattern = av
+            inner = _expand(subpattern, limit)
+            if inner is None or high > 8:
+                return None
+            options = set()
+            repeated = {""}
+            for count in range(high + 1):
+                if count >= low:
+                    options |= repeated
+                repeated = {string + option for string in repeated for option in inner}
+        else:
+            return None
+        if options is None:
+            return None
+        results = {string + option for string in results for option in options}
+        if len(results) > limit:
+            return None
+    return results
+
+
+def _covering_rule(prefix: str, rules: List[_Rule]) -> Optional[_Rule]:
+    """The first rule matching every message that starts with prefix, if any"""
+    for rule in rules:
+        if rule.prefixes is not None:
+            if any(prefix.startswith(other) for other in rule.prefixes):
+                return rule
+        elif not rule.asserts and rule.pattern.match(prefix):
+            # Having matched the prefix, the rule matches whatever follows it
+            return rule
+    return None
+
+
+def _disjoint_blocks(rules: List[_Rule]) -> List[List[_Rule]]:
+    """
+    Split rules into runs of literal rules no message is matched by two of, which can
+    be put in any order; every other rule is a run of its own
+    """
+    blocks = []
+    block = []
+    for rule in rules:
+        if rule.prefixes is None:
+            if block:
+                blocks.append(block)
+            blocks.append([rule])
+            block = []
+        elif all(_disjoint(rule.prefixes, other.prefixes) for other in block):
+            block.append(rule)
+        else:
+            blocks.append(block)
+            block = [rule]
+    if block:
+        blocks.append(block)
+    return blocks
+
+
+def _disjoint(prefixes, others) -> bool:
+    return not any(prefix.startswith(other) or other.startswith(prefix)
+                   for prefix in prefixes for other in others)
+
+
+def _has_node(parsed, ops):
+    for op, av in parsed:
+        if op in ops:
+            return True
+        for value in (av if isinstance(av, (list, tuple)) else (av,)):
+            if isinstance(value, sre_parse.SubPattern) and _has_node(value, ops):
+                return True
+            if isinstance(value, (list, tuple)):
+                for item in value:
+                    if isinstance(item, sre_parse.SubPattern) and _has_node(item, ops):
+                        return True
+    return False
+
+
+def main(argv: List[str] = None) -> None:
+    """Print the analysis of a pairs table, simplerulebased.pairs by default"""
+    argv = sys.argv[1:] if argv is None else argv
+    module_name, _, attribute = (argv[0] if argv else "simplerulebased").partition(":")
+    pairs = getattr(importlib.import_module(module_name), attribute or "pairs")
+    print(analyze_pairs(pairs).report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import re
+import random
+
+import pytest
+
+import simplerulebased
+from fastchat import FastChat, reflections, analyze_pairs
+
+
+class ReferenceChat:
+    """The matching and substitution algorithm of nltk.chat.util.Chat, which FastChat must answer like"""
+
+    def __init__(self, pairs, reflections={}):
+        self._pairs = [(re.compile(pattern, re.IGNORECASE), responses) for pattern, responses in pairs]
+        self._reflections = reflections
+        words = sorted(reflections, key=len, reverse=True)
+        self._regex = re.compile(r"\b({})\b".format("|".join(map(re.escape, words))), re.IGNORECASE)
+
+    def _substitute(self, text):
+        return self._regex.sub(lambda match: self._reflections[match.string[match.start():match.end()]],
+                               text.lower())
+
+    def _wildcards(self, response, match):
+        position = response.find("%")
+        while position >= 0:
+            number = int(response[position + 1:position + 2])
+            response = response[:position] + self._substitute(match.group(number)) + response[position + 2:]
+            position = response.find("%")
+        return response
+
+    def respond(self, text):
+        for pattern, responses in self._pairs:
+            match = pattern.match(text)
+            if match:
+                response = self._wildcards(random.choice(responses), match)
+                if response[-2:] == "?.":
+                    response = response[:-2] + "."
+                if response[-2:] == "??":
+                    response = response[:-2] + "?"
+                return response
+
+
+ELIZA_PAIRS = [
+    [r"I need (.*)", ["Why do you need %1?", "Would it really help you to get %1?"]],
+    [r"Why don\'?t you ([^\?]*)\??", ["Do you really think I don't %1?", "Perhaps eventually I will %1."]],
+    [r"I am (.*) and (.*)", ["Is it because you are %1 or %2??", "How long have you been %2 and %1?"]],
+    [r"(my|your) (\w+) (.*)", ["Why is %1 %2 %3?", "%0, you say."]],
+    [r"(.*)\?", ["Why do you ask that?", "%1?"]],
+    [r"(.*)", ["You said: %0.", "%1?", "Please tell me more."]],
+]
+
+MESSAGES = [
+    "hi", "Hello there", "HEY", "how are you?", "what is your name?", "WHAT CAN YOU DO", "help me", "bye",
+    "so what's your name?", "where is your city ?", "who created you?", "how is the weather ?", "tell me a joke",
+    "what is bitcoin", "", "  hi", "forgot password", "I need my mom", "I need you to help me",
+    "why don't you help me?", "Why dont you listen", "I am tired and my car is broken", "I am sure you are right?",
+    "my car is broken", "your answer was wrong", "are you a bot?", "I said i'm fine", "you are mean to me",
+    "I've been thinking about you and your answers", "I was happy",
+]
+
+
+def random_messages(pairs, count=2000):
+    """Messages built from the words of the patterns, so rules deep in the table match too"""
+    rng = random.Random(11)
+    words = sorted({word for pattern, _ in pairs for word in re.findall(r"[a-z']+", pattern.lower())})
+    words += ["i", "am", "you", "my", "your", "me", "?", "and"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(1, 6))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("pairs", [simplerulebased.pairs, ELIZA_PAIRS], ids=["rulebased", "eliza"])
+def test_fastchat_answers_like_nltk(pairs):
+    reference = ReferenceChat(pairs, reflections)
+    fast = FastChat(pairs, reflections)
+    assert fast._combined is not None  # The single-regex path is the one under test
+
+    for message in MESSAGES + random_messages(pairs):
+        for seed in range(3):
+            random.seed(seed)
+            expected = reference.respond(message)
+            random.seed(seed)
+            assert fast.respond(message) == expected, message
+
+
+def test_patterns_with_backreferences_are_matched_one_by_one():
+    pairs = [[r"(a)\1", ["double %1"]], [r"(.*)", ["other %1"]]]
+    fast = FastChat(pairs, reflections)
+    assert fast._combined is None
+    assert fast.respond("aa") == "double a"
+    assert fast.respond("ab") == "other ab"
+
+
+def test_nothing_matches():
+    assert FastChat([[r"hello", ["hi"]]]).respond("bye") is None
+
+
+def test_bad_response_reference():
+    with pytest.raises(ValueError):
+        FastChat([[r"(.*)", ["100%"]]])
+
+
+def test_matches_the_installed_nltk():
+    util = pytest.importorskip("nltk.chat.util")
+    for pairs in (simplerulebased.pairs, ELIZA_PAIRS):
+        reference = util.Chat(pairs, util.reflections)
+        fast = FastChat(pairs, util.reflections)
+        for message in MESSAGES:
+            random.seed(0)
+            expected = reference.respond(message)
+            random.seed(0)
+            assert fast.respond(message) == expected, message
+
+
+def assert_same_answers(original, pruned, messages):
+    reference = ReferenceChat(original, reflections)
+    fast = FastChat(pruned, reflections)
+    for message in messages:
+        for seed in range(2):
+            random.seed(seed)
+            expected = reference.respond(message)
+            random.seed(seed)
+            assert fast.respond(message) == expected, message
+
+
+# The bot's table without the early catch-all, plus rules shadowed in each way analyze_pairs detects
+NO_EARLY_CATCH_ALL = [rule for number, rule in enumerate(simplerulebased.pairs) if number != 10]
+SHADOWED_PAIRS = NO_EARLY_CATCH_ALL[:-2] + [
+    [r"help me", ["shadowed by help"]],
+    [r"how are you?", ["duplicate"]],
+    [r"HEY there|hiya", ["shadowed by hi|hello|hey"]],
+    [r"tell me a joke please|zzz", ["partially shadowed"]],
+] + NO_EARLY_CATCH_ALL[-2:]
+
+
+@pytest.mark.parametrize("pairs", [simplerulebased.pairs, NO_EARLY_CATCH_ALL, SHADOWED_PAIRS, ELIZA_PAIRS],
+                         ids=["rulebased", "no-early-catch-all", "shadowed", "eliza"])
+def test_pruned_table_answers_like_the_original(pairs):
+    messages = MESSAGES + random_messages(pairs) + ["tell me a joke please", "zzz", "hiya", "HEY there"]
+    sample = random_messages(pairs, 200)
+    for analysis in (analyze_pairs(pairs), analyze_pairs(pairs, sample=sample)):
+        assert [pairs[index] for index in analysis.order] == analysis.pairs
+        assert_same_answers(pairs, analysis.pairs, messages)
+
+
+def test_rules_after_the_catch_all_are_removed():
+    analysis = analyze_pairs(simplerulebased.pairs)
+    assert analysis.order == tuple(range(11))
+    assert [issue.index for issue in analysis.issues] == list(range(11, 26))
+    assert all(issue.kind == "unreachable" and issue.by == (10,) for issue in analysis.issues)
+
+
+def test_shadowing_is_reported():
+    issues = {issue.pattern: issue for issue in analyze_pairs(SHADOWED_PAIRS).issues}
+    assert issues["help me"].kind == "shadowed"
+    assert issues["how are you?"].kind == "duplicate"
+    assert issues["HEY there|hiya"].kind == "shadowed"
+    assert issues["tell me a joke please|zzz"].kind == "partially shadowed"
+    assert len(issues) == 4